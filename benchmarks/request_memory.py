@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк памяти при сборке тел запросов к Bedrock.
+
+Сравнивает прежнюю схему (pixmap -> PNG -> base64 -> str -> dict -> json.dumps -> bytes)
+и build_request_body. Каждый режим запускается в отдельном процессе и удерживает
+--in-flight тел запросов одновременно, как при параллельной обработке.
+Выводит прирост пикового RSS в расчете на одну страницу в обработке.
+
+Запуск:
+    python benchmarks/request_memory.py [--dpi 200] [--in-flight 8]
+"""
+import os
+import sys
+import json
+import base64
+import resource
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _peak_rss_mb() -> float:
+    """Пиковый RSS процесса в МБ (Linux: ru_maxrss в КБ)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _make_page(doc):
+    """Страница A4 с шумным изображением, чтобы PNG был реалистичного размера."""
+    import fitz
+    page = doc.new_page(width=595, height=842)
+    noise = fitz.Pixmap(fitz.csRGB, 800, 1100, os.urandom(800 * 1100 * 3), False)
+    page.insert_image(page.rect, pixmap=noise)
+    page.insert_text((72, 72), "Benchmark page", fontsize=12)
+    return page
+
+
+def _legacy_body(page, mat):
+    """Прежняя сборка тела: все промежуточные копии живут до отправки."""
+    pix = page.get_pixmap(matrix=mat)
+    image_bytes = pix.tobytes("png")
+    image_b64 = base64.b64encode(image_bytes).decode("ascii")
+    request_body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "system": [{"type": "text", "text": "system"}],
+        "messages": [{
+            "role": "user",
+            "content": [
+                {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": image_b64}},
+                {"type": "text", "text": "Extract the text from the current page image."},
+            ],
+        }],
+        "max_tokens": 9000,
+    }
+    body = json.dumps(request_body)
+    # botocore кодирует str тело в bytes перед отправкой
+    return [pix, image_bytes, image_b64, request_body, body, body.encode("utf-8")]
+
+
+def _packed_body(page, mat):
+    """Новая сборка: pixmap освобождается сразу, base64 пишется в итоговый буфер."""
+    from src.llm.request_builder import build_request_body
+    pix = page.get_pixmap(matrix=mat)
+    image_bytes = pix.tobytes("png")
+    del pix
+    body = build_request_body("system", [image_bytes, "Extract the text from the current page image."], 9000)
+    return [image_bytes, body]
+
+
+def run_mode(mode: str, dpi: int, in_flight: int) -> None:
+    """Выполняет один режим и печатает JSON с результатом."""
+    import fitz
+    doc = fitz.open()
+    page = _make_page(doc)
+    mat = fitz.Matrix(dpi / 72.0, dpi / 72.0)
+    build = _legacy_body if mode == "legacy" else _packed_body
+
+    png_size = len(page.get_pixmap(matrix=mat).tobytes("png"))
+    baseline = _peak_rss_mb()
+    held = [build(page, mat) for _ in range(in_flight)]
+    peak = _peak_rss_mb()
+    print(json.dumps({
+        "mode": mode,
+        "png_mb": round(png_size / 1024 / 1024, 2),
+        "peak_rss_delta_mb": round(peak - baseline, 1),
+        "per_page_mb": round((peak - baseline) / in_flight, 2),
+    }))
+    del held
+
+
+def main():
+    """Запускает оба режима в отдельных процессах и выводит сравнение."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--in-flight", type=int, default=8)
+    parser.add_argument("--mode", choices=["legacy", "packed"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.dpi, args.in_flight)
+        return
+
+    for mode in ("legacy", "packed"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--dpi", str(args.dpi), "--in-flight", str(args.in_flight)],
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(out)
+        print(
+            f"{result['mode']:>7}: PNG {result['png_mb']} МБ, "
+            f"пиковый RSS +{result['peak_rss_delta_mb']} МБ, "
+            f"{result['per_page_mb']} МБ на страницу в обработке"
+        )
+
+
+if __name__ == "__main__":
+    main()
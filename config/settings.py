@@ -1,7 +1,7 @@
 """Конфигурационные настройки проекта."""
 import os
 from dotenv import load_dotenv
-from typing import Dict
+from typing import Dict, Optional
 
 load_dotenv()
 
@@ -68,3 +68,79 @@ MAX_RETRIES = 5
 BASE_DELAY = 1.0
 REQUEST_DELAY = 0.2  # Задержка между запросами к Bedrock (секунды)
 
+
+# Параллельная обработка: количество документов, обрабатываемых одновременно
+MAX_CONCURRENCY = 1
+
+# Параметры оценки (dry-run планировщик)
+# Claude уменьшает изображение до 1568 px по длинной стороне и ~1600 токенов
+IMAGE_MAX_EDGE_PX = 1568
+IMAGE_MAX_TOKENS = 1600
+IMAGE_PIXELS_PER_TOKEN = 750
+CHARS_PER_TOKEN = 3.5  # Среднее количество символов на токен для извлеченного текста
+IMAGE_PAGE_OUTPUT_TOKENS = 800  # Ожидаемый вывод для страниц без текстового слоя
+CLASSIFIER_OUTPUT_TOKENS = 20  # Ответ классификатора: один JSON с одним полем
+VLM_OUTPUT_TOKENS_PER_SEC = 60.0  # Ожидаемая скорость генерации модели
+VLM_REQUEST_OVERHEAD_SEC = 2.0  # Сетевые издержки и обработка изображения на запрос
+PYMUPDF_SEC_PER_PAGE = 0.02
+# Количество векторных элементов (линий, прямоугольников), при котором страница
+# вероятно содержит таблицу или диаграмму
+TABLE_DRAWINGS_THRESHOLD = 20
+
+# Упакованный вывод (--packed): размер буфера записи шарда в байтах
+PACKED_BUFFER_SIZE = 1024 * 1024
+
+# Лимиты выходных токенов запросов к VLM
+VLM_EXTRACTION_MAX_TOKENS = 9000  # Верхняя граница для извлечения текста
+VLM_EXTRACTION_MIN_TOKENS = 1024  # Нижняя граница при оценке по текстовому слою
+VLM_OUTPUT_TOKENS_MARGIN = 2.0  # Запас к оценке (таблицы дают больше токенов, чем текстовый слой)
+CLASSIFIER_MAX_TOKENS = 50  # Ответ классификатора - один JSON с одним полем
+
+# Бюджеты расхода (None - без ограничения)
+RUN_MAX_COST_USD: Optional[float] = None
+RUN_MAX_TOKENS: Optional[int] = None
+DOCUMENT_MAX_COST_USD: Optional[float] = None
+DOCUMENT_MAX_TOKENS: Optional[int] = None
+
+# Тайловое извлечение для больших и очень плотных страниц
+TILE_OVERSIZE_FACTOR = 2.0  # Страница больше IMAGE_MAX_EDGE_PX в столько раз - режем на тайлы
+TILE_DENSE_OUTPUT_TOKENS = 3000  # Ожидаемый вывод на тайл для плотных страниц
+TILE_OVERLAP_PT = 24  # Перекрытие соседних тайлов (пункты PDF)
+TILE_MAX_TILES = 16
+TILE_CONCURRENCY = 4  # Параллельные запросы тайлов одной страницы
+TILE_MAX_OVERLAP_LINES = 20  # Максимум строк, проверяемых при удалении дублей на стыке
+
+# Дедлайны и хеджирование запросов к Bedrock
+BEDROCK_CALL_DEADLINE_SEC = 180.0  # Максимальное время одного вызова invoke_model
+BEDROCK_CONNECT_TIMEOUT_SEC = 10
+BEDROCK_MAX_POOL_CONNECTIONS = 64
+HEDGE_ENABLED = False  # Отправлять дубль запроса, если ответ дольше наблюдаемого p95
+HEDGE_BUDGET_RATIO = 0.05  # Максимальная доля вызовов, для которых отправляется дубль
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20  # Минимум наблюдений латентности до начала хеджирования
+HEDGE_LATENCY_WINDOW = 200  # Количество последних вызовов для оценки p95
+HEDGE_MAX_WORKERS = 64
+
+# Шардирование (--shard i/N): файлы длиннее SHARD_SPLIT_PAGES делятся на части
+# по SHARD_CHUNK_PAGES страниц, которые распределяются между узлами независимо
+SHARD_SPLIT_PAGES = 500
+SHARD_CHUNK_PAGES = 200
+
+# Пакетное извлечение: несколько простых страниц подряд в одном запросе к VLM
+VLM_BATCH_MAX_PAGES = 1  # Максимум страниц в запросе (1 - пакетный режим выключен)
+VLM_BATCH_MAX_OUTPUT_TOKENS = 4000  # Суммарный ожидаемый вывод страниц пакета
+VLM_BATCH_PAGE_MAX_OUTPUT_TOKENS = 1500  # Страница с большим ожидаемым выводом извлекается отдельно
+
+# Шаблоны разметки: повторное использование вердикта классификатора для страниц
+# с одинаковой геометрией (счета, выписки, формы)
+TEMPLATE_CACHE_ENABLED = True
+TEMPLATE_GRID = 40  # Координаты блоков, линий и изображений округляются до 1/TEMPLATE_GRID страницы
+TEMPLATE_MIN_CONFIRMATIONS = 3  # Одинаковых классификаций шаблона до применения вердикта без запроса
+
+# Circuit breaker: при устойчивых ошибках и троттлинге Bedrock страницы временно
+# обрабатываются PyMuPDF и помечаются как degraded, затем повторно отправляются в VLM
+BREAKER_ENABLED = True
+BREAKER_FAILURE_THRESHOLD = 5  # Неудачных попыток подряд (ошибки, троттлинг, дедлайн) до размыкания
+BREAKER_RESET_TIMEOUT_SEC = 60.0  # Время в разомкнутом состоянии до пробного запроса
+BREAKER_REQUEUE_ENABLED = True  # Повторно обрабатывать degraded страницы после восстановления
+BREAKER_REQUEUE_MAX_WAIT_SEC = 300.0  # Сколько ждать восстановления Bedrock после основной обработки
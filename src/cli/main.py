@@ -1,11 +1,29 @@
 """CLI интерфейс для парсера PDF."""
 import argparse
+import json
 import logging
 import os
+from typing import Dict, Any
 
-from config.settings import REGION
-from src.processors.pdf_processor import PDFProcessor
+from config.settings import (
+    REGION,
+    MAX_CONCURRENCY,
+    HEDGE_ENABLED,
+    VLM_BATCH_MAX_PAGES,
+    TEMPLATE_CACHE_ENABLED,
+    BREAKER_ENABLED,
+    RUN_MAX_COST_USD,
+    RUN_MAX_TOKENS,
+    DOCUMENT_MAX_COST_USD,
+    DOCUMENT_MAX_TOKENS,
+)
+from src.processors.pdf_processor import PDFProcessor, find_pdf_files
+from src.processors.planner import plan_document, summarize_plan
+from src.processors.sharding import parse_shard, build_units
+from src.output.merger import merge_shard_outputs
+from src.utils.budget import TokenBudget
 from src.output.writers import OutputWriter
+from src.output.packed_writer import PackedOutputWriter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,6 +32,40 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def print_plan(plan: Dict[str, Any]) -> None:
+    """Выводит план обработки в консоль."""
+    for doc in plan["documents"]:
+        print(
+            f"{doc['file']}: страниц {doc['total_pages']}, VLM {doc['vlm_pages']}, "
+            f"PyMuPDF {doc['pymupdf_pages']}, классификаций {doc['classifier_calls']}, "
+            f"токенов ~{doc['prompt_tokens']}/{doc['output_tokens']}, "
+            f"~${doc['cost_usd']}, ~{doc['time_sec']} сек"
+        )
+    print(
+        f"Итого: документов {plan['total_documents']}, страниц {plan['total_pages']}, "
+        f"VLM {plan['vlm_pages']}, PyMuPDF {plan['pymupdf_pages']}, "
+        f"классификаций {plan['classifier_calls']}"
+    )
+    print(f"Токены: входные ~{plan['prompt_tokens']}, выходные ~{plan['output_tokens']}")
+    print(f"Стоимость: ~${plan['cost_usd']}")
+    print(f"Время: ~{plan['wall_time_sec']} сек (concurrency={plan['concurrency']})")
+
+
+def write_template_stats(stats: Dict[str, Any], output_dir: str) -> None:
+    """Сохраняет статистику шаблонов разметки в templates.json и выводит сводку в лог."""
+    if not stats["pages"]:
+        return
+    stats_path = os.path.join(output_dir, "templates.json")
+    with open(stats_path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+    logger.info(
+        f"Шаблоны: {stats['clusters']} кластеров на {stats['pages']} страниц, "
+        f"подтверждено {stats['confirmed_clusters']}, неоднозначных {stats['conflicting_clusters']}, "
+        f"сэкономлено классификаций: {stats['calls_avoided']}"
+    )
+    logger.info(f"Сохранена статистика шаблонов: {stats_path}")
+
+
 def main():
     """Главная функция CLI."""
     parser = argparse.ArgumentParser(
@@ -24,15 +76,46 @@ def main():
     subparsers = parser.add_subparsers(dest="command", help="Команды")
     parse_parser = subparsers.add_parser("parse", help="Парсить PDF файл или директорию")
     parse_parser.add_argument("path", help="Путь к PDF файлу или директории")
-    parse_parser.add_argument("--page", type=int, help="Номер страницы для выборочного парсинга (1-based)")
+    page_group = parse_parser.add_mutually_exclusive_group()
+    page_group.add_argument("--page", type=int, help="Номер страницы для выборочного парсинга (1-based)")
+    page_group.add_argument("--pages", help="Диапазоны страниц, например 1-50,120,200- (1-based)")
     parse_parser.add_argument("--output", "-o", default="./output", help="Директория для выходных файлов (по умолчанию: ./output)")
+    parse_parser.add_argument("--dry-run", action="store_true", help="Только построить план обработки (без рендеринга и запросов к Bedrock)")
+    parse_parser.add_argument("--packed", action="store_true", help="Писать все страницы запуска в один JSONL шард с индексом вместо множества файлов")
+    parse_parser.add_argument("--compress", action="store_true", help="Сжимать упакованный шард zstd (требует пакет zstandard, только с --packed)")
+    parse_parser.add_argument("--max-cost-usd", type=float, default=RUN_MAX_COST_USD, help="Бюджет запуска в USD; при исчерпании страницы обрабатываются PyMuPDF")
+    parse_parser.add_argument("--max-tokens", type=int, default=RUN_MAX_TOKENS, help="Бюджет запуска в токенах")
+    parse_parser.add_argument("--doc-max-cost-usd", type=float, default=DOCUMENT_MAX_COST_USD, help="Бюджет одного документа в USD")
+    parse_parser.add_argument("--doc-max-tokens", type=int, default=DOCUMENT_MAX_TOKENS, help="Бюджет одного документа в токенах")
+    parse_parser.add_argument("--hedge", action="store_true", default=HEDGE_ENABLED, help="Отправлять дубль запроса к Bedrock, если ответ дольше наблюдаемого p95")
+    parse_parser.add_argument("--batch-pages", type=int, default=VLM_BATCH_MAX_PAGES, help=f"Максимум простых страниц подряд в одном запросе к VLM (по умолчанию: {VLM_BATCH_MAX_PAGES} - без пакетов)")
+    parse_parser.add_argument("--no-template-cache", dest="template_cache", action="store_false", default=TEMPLATE_CACHE_ENABLED, help="Классифицировать каждую страницу, не переиспользуя вердикты для страниц одного шаблона")
+    parse_parser.add_argument("--no-breaker", dest="breaker", action="store_false", default=BREAKER_ENABLED, help="Не переключаться на PyMuPDF при устойчивых ошибках Bedrock (только retry)")
+    parse_parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY, help=f"Количество документов, обрабатываемых параллельно в отдельных процессах (по умолчанию: {MAX_CONCURRENCY})")
+    parse_parser.add_argument("--shard", help="Обработать только часть работы: i/N (i от 0 до N-1), детерминированно по файлам и частям больших файлов")
+    
+    merge_parser = subparsers.add_parser("merge", help="Собрать результаты шардов в обычные per-document файлы")
+    merge_parser.add_argument("inputs", nargs="+", help="Директории с результатами шардов (файлы или упакованные шарды --packed)")
+    merge_parser.add_argument("--output", "-o", default="./output", help="Директория для собранных результатов (по умолчанию: ./output)")
     
     args = parser.parse_args()
     
+    if args.command == "merge":
+        merge_shard_outputs(args.inputs, args.output)
+        return
+    
     if args.command != "parse":
         parser.print_help()
         return
     
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            logger.error(str(e))
+            return
+    
     if not os.path.exists(args.path):
         logger.error(f"Путь не найден: {args.path}")
         return
@@ -43,19 +126,96 @@ def main():
     output_dir = args.output
     os.makedirs(output_dir, exist_ok=True)
     
-    processor = PDFProcessor()
-    writer = OutputWriter()
-    
-    if os.path.isfile(args.path):
-        if not args.path.lower().endswith('.pdf'):
+    if args.dry_run:
+        if os.path.isdir(args.path):
+            pdf_files = find_pdf_files(args.path)
+        elif args.path.lower().endswith('.pdf'):
+            pdf_files = [args.path]
+        else:
             logger.error("Файл должен быть PDF")
             return
         
-        results = processor.process(args.path, output_dir, page_index=args.page)
-        if results:
-            writer.write_outputs(results, output_dir)
-    elif os.path.isdir(args.path):
-        processor.process_directory(args.path, output_dir, page_index=args.page)
+        units = build_units(
+            pdf_files,
+            page_index=args.page,
+            pages=args.pages,
+            shard=shard,
+            root=args.path if os.path.isdir(args.path) else None
+        )
+        documents = []
+        for unit in units:
+            document_plan = plan_document(unit["path"], page_index=args.page, pages=unit["pages"])
+            if document_plan:
+                documents.append(document_plan)
+        plan = summarize_plan(documents, args.concurrency)
+        plan_path = os.path.join(output_dir, "plan.json")
+        with open(plan_path, "w", encoding="utf-8") as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
+        print_plan(plan)
+        logger.info(f"Сохранен план: {plan_path}")
+        return
+    
+    if os.path.isfile(args.path) and not args.path.lower().endswith('.pdf'):
+        logger.error("Файл должен быть PDF")
+        return
+    
+    processor = PDFProcessor(
+        budget=TokenBudget(args.max_cost_usd, args.max_tokens),
+        document_max_cost_usd=args.doc_max_cost_usd,
+        document_max_tokens=args.doc_max_tokens,
+        hedge=args.hedge,
+        batch_pages=args.batch_pages,
+        template_cache=args.template_cache,
+        breaker=args.breaker
+    )
+    if args.packed:
+        shard_name = f"shard-{shard[0]}-of-{shard[1]}" if shard else None
+        writer = PackedOutputWriter(output_dir, shard_name=shard_name, compress=args.compress)
     else:
-        logger.error(f"Неизвестный тип пути: {args.path}")
+        writer = OutputWriter()
+    
+    try:
+        if os.path.isfile(args.path) and shard:
+            processor.process_files(
+                [args.path],
+                output_dir,
+                page_index=args.page,
+                concurrency=args.concurrency,
+                writer=writer,
+                pages=args.pages,
+                shard=shard
+            )
+        elif os.path.isfile(args.path):
+            processor.process_file(args.path, output_dir, writer=writer, page_index=args.page, pages=args.pages)
+        elif os.path.isdir(args.path):
+            processor.process_directory(
+                args.path,
+                output_dir,
+                page_index=args.page,
+                concurrency=args.concurrency,
+                writer=writer,
+                pages=args.pages,
+                shard=shard
+            )
+        else:
+            logger.error(f"Неизвестный тип пути: {args.path}")
+    finally:
+        if args.packed:
+            writer.close()
+    
+    if processor.template_cache is not None:
+        write_template_stats(processor.template_cache.stats(), output_dir)
+    breaker_stats = processor.breaker.stats()
+    if breaker_stats["trips"]:
+        logger.warning(
+            f"Circuit breaker размыкался {breaker_stats['trips']} раз, "
+            f"отклонено запросов: {breaker_stats['rejected_calls']}, состояние: {breaker_stats['state']}"
+        )
+    hedge_stats = processor.vlm_parser.hedger.stats()
+    if hedge_stats["hedged_calls"] or hedge_stats["abandoned_calls"]:
+        logger.info(
+            f"Хеджирование: дублей {hedge_stats['hedged_calls']} из {hedge_stats['calls']} вызовов, "
+            f"дубль ответил первым: {hedge_stats['hedge_wins']}, "
+            f"брошено по дедлайну: {hedge_stats['abandoned_calls']}"
+        )
 
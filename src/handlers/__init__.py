@@ -1,5 +1,6 @@
 """Обработчики ошибок и retry логика."""
 from .retry_handler import retry_with_exponential_backoff
+from .hedge_handler import HedgedCaller
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
 
-__all__ = ['retry_with_exponential_backoff']
-
+__all__ = ['retry_with_exponential_backoff', 'HedgedCaller', 'CircuitBreaker', 'CircuitOpenError']
@@ -0,0 +1,161 @@
+"""Circuit breaker для вызовов Bedrock."""
+import time
+import logging
+import threading
+from typing import Callable, Dict, Any, TypeVar
+from botocore.exceptions import ClientError
+
+from config.settings import (
+    BREAKER_ENABLED,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT_SEC,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Вызов отклонен: circuit breaker разомкнут."""
+
+
+def is_service_failure(error: Exception) -> bool:
+    """
+    Признак проблемы на стороне сервиса: троттлинг, 5xx, таймауты и сетевые ошибки.
+    Ошибки запроса (4xx, кроме 429) сервис не характеризуют.
+    Обернутые ошибки (raise ... from e) проверяются по исходной.
+    """
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return code in {"ThrottlingException", "TooManyRequestsException"} or status == 429 or status >= 500
+    if error.__cause__ is not None:
+        return is_service_failure(error.__cause__)
+    return True
+
+
+class CircuitBreaker:
+    """
+    Потокобезопасный circuit breaker.
+
+    После failure_threshold неудачных попыток подряд (по всем потокам) размыкается:
+    вызовы сразу отклоняются с CircuitOpenError вместо ожидания retry с backoff.
+    Через reset_timeout_sec пропускается один пробный вызов; успех замыкает breaker,
+    неудача снова размыкает его на reset_timeout_sec.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = BREAKER_ENABLED,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout_sec: float = BREAKER_RESET_TIMEOUT_SEC
+    ):
+        """Инициализация в замкнутом состоянии."""
+        self.enabled = enabled
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self.state = CLOSED
+        self.trips = 0
+        self.rejected_calls = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def _allow(self) -> bool:
+        """Разрешает вызов; в разомкнутом состоянии - только пробный после таймаута."""
+        with self._lock:
+            if not self.enabled or self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self._opened_at >= self.reset_timeout_sec:
+                self.state = HALF_OPEN
+                logger.info("Circuit breaker: пробный запрос к Bedrock")
+                return True
+            self.rejected_calls += 1
+            return False
+
+    def _record_success(self) -> None:
+        """Успешный вызов замыкает breaker."""
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Circuit breaker замкнут: Bedrock снова доступен")
+            self.state = CLOSED
+            self._failures = 0
+
+    def _record_failure(self) -> None:
+        """Неудачная попытка; при достижении порога или неудачной пробе - размыкание."""
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    self.trips += 1
+                    logger.warning(
+                        f"Circuit breaker разомкнут после {self._failures} неудачных попыток подряд, "
+                        f"повтор через {self.reset_timeout_sec:.0f}s"
+                    )
+                self.state = OPEN
+                self._opened_at = time.time()
+
+    def call(self, func: Callable[[], T], operation_name: str = "operation") -> T:
+        """Выполняет func через breaker. Бросает CircuitOpenError, если вызов отклонен."""
+        if not self.enabled:
+            return func()
+        if not self._allow():
+            raise CircuitOpenError(f"{operation_name}: circuit breaker разомкнут, запрос к Bedrock не отправлен")
+        try:
+            result = func()
+        except Exception as e:
+            if is_service_failure(e):
+                self._record_failure()
+            else:
+                self._record_success()
+            raise
+        self._record_success()
+        return result
+
+    def retry_after(self) -> float:
+        """Секунды до момента, когда вызов будет пропущен (0 - можно вызывать сейчас)."""
+        with self._lock:
+            if not self.enabled or self.state == CLOSED:
+                return 0.0
+            if self.state == HALF_OPEN:
+                # Пробный запрос уже выполняется - ждем его результата
+                return min(1.0, self.reset_timeout_sec)
+            return max(0.0, self._opened_at + self.reset_timeout_sec - time.time())
+
+    def available(self) -> bool:
+        """Можно ли сейчас отправить запрос (замкнут или пора делать пробный)."""
+        return self.retry_after() == 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Копия состояния и счетчиков (для переноса между процессами)."""
+        with self._lock:
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "rejected_calls": self.rejected_calls,
+                "failures": self._failures,
+                "opened_at": self._opened_at,
+            }
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """Заменяет состояние и счетчики копией из snapshot()."""
+        with self._lock:
+            self.state = snapshot["state"]
+            self.trips = snapshot["trips"]
+            self.rejected_calls = snapshot["rejected_calls"]
+            self._failures = snapshot["failures"]
+            self._opened_at = snapshot["opened_at"]
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика breaker."""
+        with self._lock:
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "rejected_calls": self.rejected_calls,
+            }
@@ -0,0 +1,174 @@
+"""Дедлайны вызовов и хеджирование медленных запросов."""
+import math
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from config.settings import (
+    BEDROCK_CALL_DEADLINE_SEC,
+    HEDGE_ENABLED,
+    HEDGE_BUDGET_RATIO,
+    HEDGE_PERCENTILE,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_LATENCY_WINDOW,
+    HEDGE_MAX_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class DeadlineExceededError(TimeoutError):
+    """Вызов не завершился за дедлайн. abandoned - брошенные (но оплачиваемые) запросы."""
+
+    def __init__(self, message: str, abandoned: int):
+        super().__init__(message)
+        self.abandoned = abandoned
+
+
+class HedgedCaller:
+    """
+    Выполняет вызов с дедлайном и, опционально, с хеджированием.
+
+    Если вызов не завершился за наблюдаемый p95 латентности операции, отправляется
+    дубль и берется первый успешный ответ; второй игнорируется (вызов boto3 нельзя
+    отменить, поэтому он все равно оплачивается). Доля хеджированных вызовов
+    ограничена budget_ratio.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = HEDGE_ENABLED,
+        deadline_sec: float = BEDROCK_CALL_DEADLINE_SEC,
+        budget_ratio: float = HEDGE_BUDGET_RATIO,
+        percentile: float = HEDGE_PERCENTILE,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        max_workers: int = HEDGE_MAX_WORKERS
+    ):
+        """Инициализация. Пул потоков общий для всех вызовов."""
+        self.enabled = enabled
+        self.deadline_sec = deadline_sec
+        self.budget_ratio = budget_ratio
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.total_calls = 0
+        self.hedged_calls = 0
+        self.hedge_wins = 0
+        self.abandoned_calls = 0
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bedrock-call")
+
+    def _record(self, operation_name: str, latency: float) -> None:
+        """Сохраняет латентность успешного вызова."""
+        with self._lock:
+            window = self._latencies.setdefault(operation_name, deque(maxlen=HEDGE_LATENCY_WINDOW))
+            window.append(latency)
+
+    def hedge_delay(self, operation_name: str) -> Optional[float]:
+        """Задержка перед отправкой дубля (p95 операции) или None, если данных мало."""
+        with self._lock:
+            window = self._latencies.get(operation_name)
+            if not window or len(window) < self.min_samples:
+                return None
+            ordered = sorted(window)
+        return ordered[min(len(ordered) - 1, int(math.ceil(self.percentile * len(ordered))) - 1)]
+
+    def _try_acquire_hedge(self) -> bool:
+        """Проверяет бюджет хеджирования и учитывает дубль."""
+        with self._lock:
+            if self.hedged_calls + 1 > self.budget_ratio * self.total_calls:
+                return False
+            self.hedged_calls += 1
+            return True
+
+    def _timed(self, func: Callable[[], T], operation_name: str) -> Callable[[], T]:
+        """Оборачивает вызов замером латентности."""
+        def _run() -> T:
+            start = time.time()
+            result = func()
+            self._record(operation_name, time.time() - start)
+            return result
+        return _run
+
+    def _release_hedge(self) -> None:
+        """Возвращает дубль в бюджет хеджирования (дубль не отправлен)."""
+        with self._lock:
+            self.hedged_calls -= 1
+
+    def call(
+        self,
+        func: Callable[[], T],
+        operation_name: str = "operation",
+        reserve_hedge: Optional[Callable[[], bool]] = None
+    ) -> Tuple[T, bool]:
+        """
+        Выполняет func с дедлайном.
+        reserve_hedge - резервирование расхода дубля в бюджете токенов; если вернул False, дубль не отправляется.
+        Возвращает (результат, был ли отправлен дубль). При превышении дедлайна -
+        DeadlineExceededError: незавершенные запросы продолжают выполняться и оплачиваются.
+        """
+        with self._lock:
+            self.total_calls += 1
+
+        deadline = time.time() + self.deadline_sec
+        primary = self._executor.submit(self._timed(func, operation_name))
+        pending = {primary}
+        hedged = False
+
+        delay = self.hedge_delay(operation_name) if self.enabled else None
+        if delay is not None:
+            done, _ = wait(pending, timeout=min(delay, self.deadline_sec))
+            if not done and self._try_acquire_hedge():
+                if reserve_hedge is not None and not reserve_hedge():
+                    self._release_hedge()
+                    logger.info(f"{operation_name}: дубль запроса не отправлен - бюджет исчерпан")
+                else:
+                    logger.info(f"{operation_name}: нет ответа за p95={delay:.1f}s, отправлен дубль запроса")
+                    pending.add(self._executor.submit(self._timed(func, operation_name)))
+                    hedged = True
+
+        error = None
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result(), hedged
+                error = error or future.exception()
+
+        if error is not None and not pending:
+            raise error
+        with self._lock:
+            self.abandoned_calls += len(pending)
+        raise DeadlineExceededError(
+            f"{operation_name}: превышен дедлайн {self.deadline_sec:.0f}s",
+            len(pending)
+        )
+
+    def merge_stats(self, stats: Dict[str, int]) -> None:
+        """Добавляет счетчики, накопленные другим HedgedCaller (например, в процессе-обработчике)."""
+        with self._lock:
+            self.total_calls += stats["calls"]
+            self.hedged_calls += stats["hedged_calls"]
+            self.hedge_wins += stats["hedge_wins"]
+            self.abandoned_calls += stats["abandoned_calls"]
+
+    def stats(self) -> Dict[str, int]:
+        """Статистика хеджирования."""
+        with self._lock:
+            return {
+                "calls": self.total_calls,
+                "hedged_calls": self.hedged_calls,
+                "hedge_wins": self.hedge_wins,
+                "abandoned_calls": self.abandoned_calls,
+            }
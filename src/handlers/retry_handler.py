@@ -5,6 +5,7 @@ from typing import Callable, TypeVar, Optional
 from botocore.exceptions import ClientError
 
 from config.settings import MAX_RETRIES, BASE_DELAY
+from src.handlers.circuit_breaker import CircuitOpenError
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +33,9 @@ def retry_with_exponential_backoff(
     for attempt in range(max_retries):
         try:
             return func()
+        except CircuitOpenError:
+            # Breaker разомкнут - повторять бессмысленно
+            raise
         except ClientError as e:
             code = e.response.get("Error", {}).get("Code", "")
             status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
@@ -1,9 +1,16 @@
 """Клиент для работы с AWS Bedrock."""
 import boto3
 import instructor
+from botocore.config import Config
 from typing import Optional
 
-from config.settings import REGION, MODEL_NAME
+from config.settings import (
+    REGION,
+    MODEL_NAME,
+    BEDROCK_CALL_DEADLINE_SEC,
+    BEDROCK_CONNECT_TIMEOUT_SEC,
+    BEDROCK_MAX_POOL_CONNECTIONS,
+)
 
 
 class BedrockClient:
@@ -14,13 +21,29 @@ class BedrockClient:
         self.region = region or REGION
         self.bedrock_runtime = boto3.client(
             service_name="bedrock-runtime",
-            region_name=self.region
+            region_name=self.region,
+            config=Config(
+                read_timeout=BEDROCK_CALL_DEADLINE_SEC,
+                connect_timeout=BEDROCK_CONNECT_TIMEOUT_SEC,
+                max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+                # Повторы выполняет retry_with_exponential_backoff: повторы botocore
+                # продлевали бы вызов за дедлайн HedgedCaller
+                retries={"total_max_attempts": 1}
+            )
         )
         self.instructor_client = instructor.from_provider(
             f"bedrock/{MODEL_NAME}",
             region_name=self.region
         )
     
+    def __getstate__(self):
+        """Клиенты boto3 не сериализуются: в другой процесс передается только регион."""
+        return {"region": self.region}
+    
+    def __setstate__(self, state):
+        """Пересоздает клиенты в процессе-получателе."""
+        self.__init__(state["region"])
+    
     @property
     def runtime_client(self):
         """Возвращает boto3 bedrock-runtime клиент."""
@@ -0,0 +1,79 @@
+"""Сборка тел запросов к Bedrock без лишних копий изображений."""
+import json
+import uuid
+import binascii
+from typing import List, Sequence, Union
+
+# Размер блока исходных байтов для base64 (кратен 3, чтобы не было паддинга внутри)
+_B64_CHUNK_SIZE = 3 * 64 * 1024
+
+
+def _b64_length(size: int) -> int:
+    """Длина base64 представления для size байтов."""
+    return 4 * ((size + 2) // 3)
+
+
+def _write_b64(buffer: memoryview, offset: int, data: bytes) -> int:
+    """Пишет base64 представление data в буфер по частям, возвращает новый offset."""
+    view = memoryview(data)
+    for start in range(0, len(view), _B64_CHUNK_SIZE):
+        encoded = binascii.b2a_base64(view[start:start + _B64_CHUNK_SIZE], newline=False)
+        buffer[offset:offset + len(encoded)] = encoded
+        offset += len(encoded)
+    return offset
+
+
+def build_request_body(
+    system_prompt: str,
+    content: Sequence[Union[bytes, str]],
+    max_tokens: int
+) -> bytearray:
+    """
+    Собирает JSON тело запроса Anthropic Messages API для invoke_model.
+
+    Args:
+        system_prompt: Системный промпт
+        content: Блоки сообщения пользователя: bytes - PNG изображение, str - текст
+        max_tokens: Лимит выходных токенов
+
+    Returns:
+        Готовое тело запроса. Изображения кодируются в base64 сразу в итоговый
+        буфер, без промежуточных base64-строк, словарей и json.dumps всего тела.
+    """
+    marker = f"@@image-{uuid.uuid4().hex}@@"
+    images: List[bytes] = []
+    blocks = []
+    for block in content:
+        if isinstance(block, str):
+            blocks.append({"type": "text", "text": block})
+        else:
+            blocks.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/png",
+                    "data": marker
+                }
+            })
+            images.append(block)
+
+    skeleton = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "system": [{"type": "text", "text": system_prompt}],
+        "messages": [{"role": "user", "content": blocks}],
+        "max_tokens": max_tokens
+    }
+    # Каркас без изображений мал; маркер стоит на месте каждого изображения
+    parts = json.dumps(skeleton).encode("utf-8").split(marker.encode("ascii"))
+
+    total = sum(len(p) for p in parts) + sum(_b64_length(len(img)) for img in images)
+    body = bytearray(total)
+    buffer = memoryview(body)
+    offset = 0
+    for i, part in enumerate(parts):
+        buffer[offset:offset + len(part)] = part
+        offset += len(part)
+        if i < len(images):
+            offset = _write_b64(buffer, offset, images[i])
+    buffer.release()
+    return body
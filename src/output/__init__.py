@@ -1,5 +1,5 @@
 """Модуль для генерации выходных файлов."""
 from .writers import OutputWriter
+from .packed_writer import PackedOutputWriter, read_packed_document
 
-__all__ = ['OutputWriter']
-
+__all__ = ['OutputWriter', 'PackedOutputWriter', 'read_packed_document']
@@ -0,0 +1,127 @@
+"""Сборка результатов шардов в обычные per-document выходные файлы."""
+import os
+import json
+import logging
+from typing import Dict, Any, List
+
+from src.output.writers import OutputWriter
+from src.output.packed_writer import read_packed_document
+
+logger = logging.getLogger(__name__)
+
+
+def _source_name(source: str) -> str:
+    """Имя документа: путь source (относительно входной директории) без расширения."""
+    return os.path.join(*os.path.splitext(source)[0].split("/"))
+
+
+def _document_name(input_dir: str, metrics_dir: str, metrics: Dict[str, Any]) -> str:
+    """
+    Имя документа по полю source metrics.json. Для результатов, записанных
+    до появления source, - по расположению: <pdf>/ или <pdf>/parts/<диапазон>/.
+    """
+    if metrics.get("source"):
+        return _source_name(metrics["source"])
+    rel_parts = os.path.relpath(metrics_dir, input_dir).split(os.sep)
+    if len(rel_parts) >= 3 and rel_parts[-2] == "parts":
+        return os.path.join(*rel_parts[:-2])
+    if rel_parts == ["."]:
+        return os.path.splitext(metrics["file"])[0]
+    return os.path.join(*rel_parts)
+
+
+def _load_pages(metrics_dir: str, metrics: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Загружает метрики и содержимое страниц одного результата."""
+    pages = []
+    for page_metrics in metrics["pages"]:
+        page_md_path = os.path.join(metrics_dir, "pages", f"{page_metrics['page']}.md")
+        content = ""
+        if os.path.exists(page_md_path):
+            with open(page_md_path, "r", encoding="utf-8") as f:
+                content = f.read()
+        pages.append({"metrics": page_metrics, "content": content})
+    return pages
+
+
+def _load_packed(index_path: str) -> List[Dict[str, Any]]:
+    """
+    Загружает документы упакованного шарда по его индексу:
+    [{"name", "file", "source", "pages"}], name - путь source без расширения.
+    """
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+
+    documents = []
+    sources = sorted({entry["source"] for entry in index["documents"]})
+    for source in sources:
+        pages = []
+        for row in read_packed_document(index_path, source):
+            content = row.pop("content")
+            row.pop("source")
+            file_name = row.pop("file")
+            pages.append({"metrics": row, "content": content})
+        documents.append({
+            "name": _source_name(source),
+            "file": file_name,
+            "source": source,
+            "pages": pages,
+        })
+    return documents
+
+
+def merge_shard_outputs(input_dirs: List[str], output_dir: str) -> int:
+    """
+    Объединяет результаты шардов (целые документы и части <pdf>/parts/*,
+    а также упакованные шарды --packed по их индексу <шард>.index.json)
+    в обычную структуру <output_dir>/<pdf>/ с metrics.json и Markdown.
+    Страницы, встречающиеся несколько раз, берутся из первого результата.
+    Возвращает количество собранных документов.
+    """
+    documents: Dict[str, Dict[str, Any]] = {}
+
+    for input_dir in input_dirs:
+        for root, dirs, files in os.walk(input_dir):
+            dirs.sort()
+            for index_name in sorted(f for f in files if f.endswith(".index.json")):
+                for packed in _load_packed(os.path.join(root, index_name)):
+                    document = documents.setdefault(
+                        packed["name"],
+                        {"file": packed["file"], "source": packed["source"], "pages": {}}
+                    )
+                    for page in packed["pages"]:
+                        document["pages"].setdefault(page["metrics"]["page"], page)
+            if "metrics.json" not in files:
+                continue
+            with open(os.path.join(root, "metrics.json"), "r", encoding="utf-8") as f:
+                metrics = json.load(f)
+
+            name = _document_name(input_dir, root, metrics)
+            source = metrics.get("source") or name.replace(os.sep, "/") + os.path.splitext(metrics["file"])[1]
+            document = documents.setdefault(name, {"file": metrics["file"], "source": source, "pages": {}})
+            for page in _load_pages(root, metrics):
+                document["pages"].setdefault(page["metrics"]["page"], page)
+
+    writer = OutputWriter()
+    for name, document in sorted(documents.items()):
+        pages = [document["pages"][page_num] for page_num in sorted(document["pages"])]
+        page_metrics = [p["metrics"] for p in pages]
+        # Стоимость пересчитывается по страницам: части одного документа могли пересекаться
+        results = {
+            "file": document["file"],
+            "source": document["source"],
+            "total_pages": len(pages),
+            "total_tokens": sum(p.get("tokens", 0) for p in page_metrics),
+            "total_time_sec": round(sum(p.get("time_sec", 0.0) for p in page_metrics), 2),
+            "total_cost_usd": round(sum(p.get("cost_usd", 0.0) for p in page_metrics), 6),
+            "hedge_tokens": sum(p.get("hedge_tokens", 0) for p in page_metrics),
+            "hedge_cost_usd": round(sum(p.get("hedge_cost_usd", 0.0) for p in page_metrics), 6),
+            "classifier_calls_avoided": sum(1 for p in page_metrics if p.get("classifier_cached")),
+            "degraded_pages": sum(1 for p in page_metrics if p.get("degraded")),
+            "upgraded_pages": sum(1 for p in page_metrics if p.get("upgraded")),
+            "pages": page_metrics,
+            "pages_content": [{"page": p["metrics"]["page"], "content": p["content"]} for p in pages],
+        }
+        writer.write_outputs(results, os.path.join(output_dir, name))
+
+    logger.info(f"Собрано документов: {len(documents)}")
+    return len(documents)
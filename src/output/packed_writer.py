@@ -0,0 +1,142 @@
+"""Упакованный формат вывода: один JSONL шард на запуск вместо множества файлов."""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+from config.settings import PACKED_BUFFER_SIZE
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _page_rows(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Строки шарда: путь документа, метрики страницы и ее содержимое."""
+    rows = []
+    for metrics, page_data in zip(results["pages"], results["pages_content"]):
+        row = {"file": results["file"], "source": results.get("source", results["file"])}
+        row.update(metrics)
+        row["content"] = page_data["content"].strip() if page_data.get("content") else ""
+        rows.append(row)
+    return rows
+
+
+class PackedOutputWriter:
+    """
+    Пишет страницы всех документов запуска в один JSONL шард.
+
+    Каждый документ - непрерывный блок строк (при сжатии - отдельный zstd фрейм),
+    его смещение и длина в байтах записываются в индекс <шард>.index.json,
+    что позволяет читать отдельный документ без чтения всего шарда.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        shard_name: Optional[str] = None,
+        compress: bool = False
+    ):
+        """Открывает шард для буферизованной дозаписи."""
+        if compress and zstandard is None:
+            raise RuntimeError("Для сжатия требуется пакет zstandard: pip install zstandard")
+
+        os.makedirs(output_dir, exist_ok=True)
+        name = shard_name or time.strftime("run-%Y%m%d-%H%M%S")
+        extension = ".jsonl.zst" if compress else ".jsonl"
+
+        self.compress = compress
+        self.shard_path = os.path.join(output_dir, f"{name}{extension}")
+        self.index_path = f"{self.shard_path}.index.json"
+        self._compressor = zstandard.ZstdCompressor() if compress else None
+        self._file = open(self.shard_path, "wb", buffering=PACKED_BUFFER_SIZE)
+        self._offset = 0
+        self._documents: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def write_outputs(self, results: Dict[str, Any], output_dir: Optional[str] = None) -> None:
+        """
+        Дописывает документ в шард. Сигнатура совместима с OutputWriter,
+        output_dir игнорируется - все документы попадают в один шард.
+        """
+        rows = _page_rows(results)
+        data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+        with self._lock:
+            # ZstdCompressor не потокобезопасен - сжимаем под блокировкой
+            if self._compressor is not None:
+                data = self._compressor.compress(data)
+            self._file.write(data)
+            self._documents.append({
+                "file": results["file"],
+                "source": results.get("source", results["file"]),
+                "part": results.get("part"),
+                "offset": self._offset,
+                "length": len(data),
+                "total_pages": results["total_pages"],
+                "total_tokens": results["total_tokens"],
+                "total_time_sec": results["total_time_sec"],
+                "total_cost_usd": results["total_cost_usd"],
+                "hedge_tokens": results.get("hedge_tokens", 0),
+                "hedge_cost_usd": results.get("hedge_cost_usd", 0.0),
+                "classifier_calls_avoided": results.get("classifier_calls_avoided", 0),
+                "degraded_pages": results.get("degraded_pages", 0),
+                "upgraded_pages": results.get("upgraded_pages", 0),
+            })
+            self._offset += len(data)
+        logger.info(f"Добавлен в шард {self.shard_path}: {results.get('source', results['file'])} ({len(rows)} страниц)")
+
+    def close(self) -> None:
+        """Сбрасывает буфер шарда и записывает индекс."""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.close()
+            index = {
+                "shard": os.path.basename(self.shard_path),
+                "compression": "zstd" if self.compress else None,
+                "documents": self._documents,
+            }
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False, indent=2)
+        logger.info(f"Сохранен шард: {self.shard_path} ({len(self._documents)} документов)")
+
+    def __enter__(self) -> "PackedOutputWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def read_packed_document(index_path: str, source: str) -> List[Dict[str, Any]]:
+    """
+    Читает страницы одного документа из шарда по индексу (произвольный доступ).
+    source - путь файла относительно входной директории, как в поле "source" индекса.
+    """
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+
+    entries = [d for d in index["documents"] if d["source"] == source]
+    if not entries:
+        raise KeyError(f"Документ {source} не найден в индексе {index_path}")
+
+    # При шардировании документ может быть записан несколькими частями
+    shard_path = os.path.join(os.path.dirname(index_path), index["shard"])
+    rows = []
+    with open(shard_path, "rb") as f:
+        for entry in entries:
+            f.seek(entry["offset"])
+            data = f.read(entry["length"])
+
+            if index.get("compression") == "zstd":
+                if zstandard is None:
+                    raise RuntimeError("Для чтения сжатого шарда требуется пакет zstandard: pip install zstandard")
+                data = zstandard.ZstdDecompressor().decompress(data)
+
+            rows.extend(json.loads(line) for line in data.decode("utf-8").splitlines() if line)
+    return sorted(rows, key=lambda row: row["page"])
@@ -17,10 +17,17 @@ class OutputWriter:
         # JSON с метриками
         metrics = {
             "file": results["file"],
+            "source": results.get("source", results["file"]),
+            "part": results.get("part"),
             "total_pages": results["total_pages"],
             "total_tokens": results["total_tokens"],
             "total_time_sec": results["total_time_sec"],
             "total_cost_usd": results["total_cost_usd"],
+            "hedge_tokens": results.get("hedge_tokens", 0),
+            "hedge_cost_usd": results.get("hedge_cost_usd", 0.0),
+            "classifier_calls_avoided": results.get("classifier_calls_avoided", 0),
+            "degraded_pages": results.get("degraded_pages", 0),
+            "upgraded_pages": results.get("upgraded_pages", 0),
             "pages": results["pages"],
         }
         
@@ -1,18 +1,29 @@
 """VLM парсер для сложных страниц с таблицами и изображениями."""
-import base64
 import json
 import re
 import time
 import logging
-from typing import Tuple, Dict, Optional
+from typing import Callable, Tuple, Dict, Optional, Any, List
 
 from botocore.exceptions import ClientError
 
-from config.settings import MODEL_NAME, REQUEST_DELAY
-from config.prompts import VLM_CLASSIFIER_SYSTEM_PROMPT, VLM_EXTRACTION_SYSTEM_PROMPT
+from config.settings import (
+    MODEL_NAME,
+    REQUEST_DELAY,
+    CLASSIFIER_MAX_TOKENS,
+    VLM_EXTRACTION_MAX_TOKENS,
+)
+from config.prompts import (
+    VLM_CLASSIFIER_SYSTEM_PROMPT,
+    VLM_EXTRACTION_SYSTEM_PROMPT,
+    VLM_BATCH_EXTRACTION_SYSTEM_PROMPT,
+)
 from src.llm.bedrock_client import BedrockClient
-from src.utils.usage_parser import parse_bedrock_usage
+from src.llm.request_builder import build_request_body
+from src.utils.usage_parser import parse_bedrock_usage, merge_usage
 from src.handlers.retry_handler import retry_with_exponential_backoff
+from src.handlers.hedge_handler import HedgedCaller, DeadlineExceededError
+from src.handlers.circuit_breaker import CircuitBreaker
 from pydantic import BaseModel, Field
 
 
@@ -38,6 +49,36 @@ def clean_extracted_text(text: str) -> str:
     return text.strip()
 
 
+def split_batch_response(text: str, page_count: int) -> Optional[List[str]]:
+    """
+    Делит ответ пакетного извлечения по разделителям <<<PAGE N>>>.
+    Возвращает тексты страниц по порядку или None, если разделители не совпадают со страницами.
+    """
+    matches = list(re.finditer(r'^[ \t]*<<<PAGE\s+(\d+)>>>[ \t]*$', text, flags=re.MULTILINE))
+    pages: Dict[int, str] = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        page_num = int(match.group(1))
+        if page_num in pages:
+            return None
+        pages[page_num] = clean_extracted_text(text[match.end():end])
+    if sorted(pages) != list(range(1, page_count + 1)):
+        return None
+    return [pages[page_num] for page_num in range(1, page_count + 1)]
+
+
+class ExtractionError(RuntimeError):
+    """Ошибка извлечения; usage - расход уже выполненных запросов (учитывается в бюджете и метриках)."""
+    
+    def __init__(self, message: str, usage: Optional[Dict[str, int]] = None):
+        super().__init__(message)
+        self.usage = usage or {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+
+class TruncatedResponseError(ExtractionError):
+    """Ответ обрезан по max_tokens, а бюджет не позволяет повторить запрос с верхней границей."""
+
+
 class VLMClassifierResult(BaseModel):
     """Результат классификации страницы через VLM."""
     has_table_or_diagram: bool = Field(
@@ -48,97 +89,136 @@ class VLMClassifierResult(BaseModel):
 class VLMParser:
     """VLM парсер через AWS Bedrock для сложных страниц."""
     
-    def __init__(self, bedrock_client: Optional[BedrockClient] = None):
+    def __init__(
+        self,
+        bedrock_client: Optional[BedrockClient] = None,
+        hedger: Optional[HedgedCaller] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
         """Инициализация парсера."""
         self.client = bedrock_client or BedrockClient()
         self.model_id = MODEL_NAME
+        self.hedger = hedger or HedgedCaller()
+        self.breaker = breaker or CircuitBreaker()
     
-    def classify_page(self, image_bytes: bytes) -> Tuple[bool, Dict[str, int]]:
+    def _invoke(
+        self,
+        request_body: bytearray,
+        operation_name: str,
+        reserve_hedge: Optional[Callable[[], bool]] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, int]]:
         """
-        Классифицирует страницу на наличие таблиц/диаграмм.
-        Возвращает (has_table_or_diagram, usage_metrics).
+        Вызывает invoke_model с retry, дедлайном, хеджированием и через circuit breaker.
+        reserve_hedge - резервирование расхода дубля в бюджете (см. HedgedCaller.call).
+        Возвращает (response_body, usage_metrics). При разомкнутом breaker - CircuitOpenError.
         """
-        image_b64 = base64.b64encode(image_bytes).decode("ascii")
-        
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/png",
-                            "data": image_b64
-                        }
-                    }
-                ]
-            }
-        ]
-        
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "system": [{"type": "text", "text": VLM_CLASSIFIER_SYSTEM_PROMPT.strip()}],
-            "messages": messages,
-            "max_tokens": 1000
-        }
-        
-        def _classify():
+        def _call():
             response = self.client.runtime_client.invoke_model(
                 modelId=self.model_id,
-                body=json.dumps(request_body),
+                body=request_body,
                 accept="application/json",
                 contentType="application/json"
             )
-            return response
+            return json.loads(response['body'].read().decode('utf-8'))
+        
+        abandoned = 0
+        
+        def _hedged_call():
+            nonlocal abandoned
+            try:
+                return self.hedger.call(_call, operation_name, reserve_hedge=reserve_hedge)
+            except DeadlineExceededError as e:
+                abandoned += e.abandoned
+                raise
+        
+        response_body, hedged = retry_with_exponential_backoff(
+            lambda: self.breaker.call(_hedged_call, operation_name),
+            operation_name=operation_name
+        )
+        usage = parse_bedrock_usage(response_body)
+        extra_calls = int(hedged) + abandoned
+        if extra_calls:
+            # Дубль и запросы, брошенные по дедлайну, тоже оплачиваются:
+            # расход каждого оценивается расходом ответа
+            extra_usage = {key: usage[key] * extra_calls for key in ("prompt_tokens", "completion_tokens", "total_tokens")}
+            hedge_usage = {
+                "hedge_prompt_tokens": extra_usage["prompt_tokens"],
+                "hedge_completion_tokens": extra_usage["completion_tokens"],
+                "hedge_tokens": extra_usage["total_tokens"],
+            }
+            usage = merge_usage(usage, extra_usage, hedge_usage)
+        return response_body, usage
+    
+    def classify_page(
+        self,
+        image_bytes: bytes,
+        max_tokens: int = CLASSIFIER_MAX_TOKENS,
+        reserve: Optional[Callable[[int], bool]] = None
+    ) -> Tuple[bool, Dict[str, int]]:
+        """
+        Классифицирует страницу на наличие таблиц/диаграмм.
+        reserve(max_tokens) - резервирование в бюджете дополнительного запроса (дубля при хеджировании).
+        Возвращает (has_table_or_diagram, usage_metrics).
+        Ошибка запроса пробрасывается (CircuitOpenError, если breaker разомкнут).
+        """
+        request_body = build_request_body(
+            VLM_CLASSIFIER_SYSTEM_PROMPT.strip(),
+            [image_bytes],
+            max_tokens=max_tokens
+        )
         
         try:
-            response = retry_with_exponential_backoff(
-                _classify,
-                operation_name="VLM classifier"
+            response_body, usage = self._invoke(
+                request_body,
+                "VLM classifier",
+                reserve_hedge=(lambda: reserve(max_tokens)) if reserve else None
             )
-            
-            response_body = json.loads(response['body'].read().decode('utf-8'))
-            usage = parse_bedrock_usage(response_body)
-            
-            # Парсим ответ для получения результата классификации
-            content_blocks = response_body.get('content', [])
-            if content_blocks and 'text' in content_blocks[0]:
-                response_text = content_blocks[0]['text'].strip()
-                # Парсим JSON ответ
-                try:
-                    # Удаляем markdown code blocks если есть
-                    cleaned_text = re.sub(r'```json\s*', '', response_text)
-                    cleaned_text = re.sub(r'```\s*', '', cleaned_text)
-                    cleaned_text = cleaned_text.strip()
-                    
-                    # Парсим JSON
-                    result_dict = json.loads(cleaned_text)
-                    has_table_or_diagram = result_dict.get("has_table_or_diagram", False)
-                except (json.JSONDecodeError, KeyError) as e:
-                    logger.warning(f"Failed to parse classifier response as JSON: {e}. Response: {response_text[:200]}")
-                    # Fallback: ищем ключевые слова в ответе
-                    has_table_or_diagram = "true" in response_text.lower() or '"has_table_or_diagram": true' in response_text
-            else:
-                logger.warning("Empty response from classifier")
-                has_table_or_diagram = False
-            
-            return has_table_or_diagram, usage
         except Exception as e:
             logger.error(f"Bedrock classifier invocation failed: {e}")
-            return False, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            raise
+        
+        # Парсим ответ для получения результата классификации
+        content_blocks = response_body.get('content', [])
+        if content_blocks and 'text' in content_blocks[0]:
+            response_text = content_blocks[0]['text'].strip()
+            # Парсим JSON ответ
+            try:
+                # Удаляем markdown code blocks если есть
+                cleaned_text = re.sub(r'```json\s*', '', response_text)
+                cleaned_text = re.sub(r'```\s*', '', cleaned_text)
+                cleaned_text = cleaned_text.strip()
+                
+                # Парсим JSON
+                result_dict = json.loads(cleaned_text)
+                has_table_or_diagram = result_dict.get("has_table_or_diagram", False)
+            except (json.JSONDecodeError, KeyError) as e:
+                logger.warning(f"Failed to parse classifier response as JSON: {e}. Response: {response_text[:200]}")
+                # Fallback: ищем ключевые слова в ответе
+                has_table_or_diagram = "true" in response_text.lower() or '"has_table_or_diagram": true' in response_text
+        else:
+            logger.warning("Empty response from classifier")
+            has_table_or_diagram = False
+        
+        return has_table_or_diagram, usage
     
     def extract_text(
         self,
         image_bytes: bytes,
-        previous_page_text: str = ""
+        previous_page_text: str = "",
+        max_tokens: int = VLM_EXTRACTION_MAX_TOKENS,
+        reserve: Optional[Callable[[int], bool]] = None
     ) -> Tuple[str, Dict[str, int], float]:
         """
         Извлекает текст из страницы через VLM.
+        Если ответ обрезан по max_tokens ниже верхней границы,
+        запрос повторяется с VLM_EXTRACTION_MAX_TOKENS.
+        reserve(max_tokens) - резервирование в бюджете дополнительного запроса
+        (повтора или дубля); если повтор не зарезервирован - TruncatedResponseError.
         Возвращает (extracted_text, usage_metrics, elapsed_time).
+        При ошибке бросает ExtractionError с расходом выполненных запросов.
         """
         start_time = time.time()
-        image_b64 = base64.b64encode(image_bytes).decode("ascii")
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
         
         previous_text_block = (
             f"\n<previous_page>\n{previous_page_text[:500]}\n</previous_page>"
@@ -146,50 +226,31 @@ class VLMParser:
         )
         user_prompt = f"Extract the text from the current page image.{previous_text_block}"
         
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/png",
-                            "data": image_b64
-                        }
-                    },
-                    {
-                        "type": "text",
-                        "text": user_prompt
-                    }
-                ]
-            }
-        ]
-        
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "system": [{"type": "text", "text": VLM_EXTRACTION_SYSTEM_PROMPT}],
-            "messages": messages,
-            "max_tokens": 9000
-        }
-        
-        def _extract():
-            response = self.client.runtime_client.invoke_model(
-                modelId=self.model_id,
-                body=json.dumps(request_body),
-                accept="application/json",
-                contentType="application/json"
+        def _extract(limit: int):
+            request_body = build_request_body(
+                VLM_EXTRACTION_SYSTEM_PROMPT,
+                [image_bytes, user_prompt],
+                max_tokens=limit
+            )
+            return self._invoke(
+                request_body,
+                "VLM extraction",
+                reserve_hedge=(lambda: reserve(limit)) if reserve else None
             )
-            return response
         
         try:
-            response = retry_with_exponential_backoff(
-                _extract,
-                operation_name="VLM extraction"
-            )
+            response_body, usage = _extract(max_tokens)
+            
+            if response_body.get("stop_reason") == "max_tokens" and max_tokens < VLM_EXTRACTION_MAX_TOKENS:
+                if reserve is not None and not reserve(VLM_EXTRACTION_MAX_TOKENS):
+                    raise TruncatedResponseError(
+                        f"Extraction truncated at max_tokens={max_tokens}, budget does not allow a retry",
+                        usage
+                    )
+                logger.warning(f"Extraction truncated at max_tokens={max_tokens}, retrying with {VLM_EXTRACTION_MAX_TOKENS}")
+                response_body, retry_usage = _extract(VLM_EXTRACTION_MAX_TOKENS)
+                usage = merge_usage(usage, retry_usage)
             
-            response_body = json.loads(response['body'].read().decode('utf-8'))
-            usage = parse_bedrock_usage(response_body)
             elapsed = time.time() - start_time
             
             content_blocks = response_body.get('content', [])
@@ -200,8 +261,63 @@ class VLMParser:
                 time.sleep(REQUEST_DELAY)  # Задержка между запросами
                 return cleaned_text, usage, elapsed
             return "", usage, elapsed
+        except ExtractionError:
+            raise
         except Exception as e:
             elapsed = time.time() - start_time
             logger.error(f"Bedrock extraction invocation failed: {e}")
-            raise RuntimeError(f"Bedrock extraction failed: {e}")
-
+            raise ExtractionError(f"Bedrock extraction failed: {e}", usage) from e
+    
+    def extract_batch(
+        self,
+        images: List[bytes],
+        previous_page_text: str = "",
+        max_tokens: int = VLM_EXTRACTION_MAX_TOKENS,
+        reserve: Optional[Callable[[int], bool]] = None
+    ) -> Tuple[Optional[List[str]], Dict[str, int], float]:
+        """
+        Извлекает текст нескольких последовательных страниц одним запросом.
+        reserve(max_tokens) - резервирование в бюджете дубля при хеджировании.
+        Возвращает (тексты страниц, usage_metrics, elapsed_time); тексты - None,
+        если ответ обрезан или не делится на страницы (их нужно извлечь по одной).
+        """
+        start_time = time.time()
+        
+        previous_text_block = (
+            f"\n<previous_page>\n{previous_page_text[:500]}\n</previous_page>"
+            if previous_page_text else ""
+        )
+        content = []
+        for page_num, image_bytes in enumerate(images, start=1):
+            content.append(f"Page {page_num}:")
+            content.append(image_bytes)
+        content.append(f"Extract the text from each of the {len(images)} page images.{previous_text_block}")
+        
+        request_body = build_request_body(
+            VLM_BATCH_EXTRACTION_SYSTEM_PROMPT,
+            content,
+            max_tokens=max_tokens
+        )
+        
+        try:
+            response_body, usage = self._invoke(
+                request_body,
+                "VLM batch extraction",
+                reserve_hedge=(lambda: reserve(max_tokens)) if reserve else None
+            )
+        except Exception as e:
+            logger.error(f"Bedrock batch extraction invocation failed: {e}")
+            raise RuntimeError(f"Bedrock batch extraction failed: {e}") from e
+        elapsed = time.time() - start_time
+        time.sleep(REQUEST_DELAY)  # Задержка между запросами
+        
+        if response_body.get("stop_reason") == "max_tokens":
+            logger.warning(f"Batch extraction of {len(images)} pages truncated at max_tokens={max_tokens}")
+            return None, usage, elapsed
+        
+        content_blocks = response_body.get('content', [])
+        response_text = content_blocks[0]['text'] if content_blocks and 'text' in content_blocks[0] else ""
+        texts = split_batch_response(response_text, len(images))
+        if texts is None:
+            logger.warning(f"Batch extraction response does not match {len(images)} page delimiters")
+        return texts, usage, elapsed
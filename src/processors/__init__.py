@@ -1,4 +1,5 @@
 """Процессоры для обработки PDF."""
 from .pdf_processor import PDFProcessor
+from .planner import plan_document, plan_files
 
-__all__ = ['PDFProcessor']
+__all__ = ['PDFProcessor', 'plan_document', 'plan_files']
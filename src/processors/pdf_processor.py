@@ -3,16 +3,54 @@ import os
 import time
 import fitz
 import logging
-from typing import Dict, Optional, Any, List
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Optional, Any, List, Tuple
 from pathlib import Path
 
-from config.settings import DEFAULT_DPI
+from config.settings import (
+    DEFAULT_DPI,
+    MAX_CONCURRENCY,
+    MIN_TEXT_LENGTH,
+    TILE_CONCURRENCY,
+    CLASSIFIER_MAX_TOKENS,
+    RUN_MAX_COST_USD,
+    RUN_MAX_TOKENS,
+    DOCUMENT_MAX_COST_USD,
+    DOCUMENT_MAX_TOKENS,
+    HEDGE_ENABLED,
+    VLM_EXTRACTION_MAX_TOKENS,
+    VLM_BATCH_MAX_PAGES,
+    VLM_BATCH_MAX_OUTPUT_TOKENS,
+    VLM_BATCH_PAGE_MAX_OUTPUT_TOKENS,
+    TEMPLATE_CACHE_ENABLED,
+    BREAKER_ENABLED,
+    BREAKER_REQUEUE_ENABLED,
+)
 from src.utils.page_analyzer import analyze_page
 from src.utils.cost_calculator import get_model_cost
+from src.utils.budget import TokenBudget, ExtraReservations
+from src.utils.tiling import plan_tiles, stitch_tiles
+from src.utils.page_ranges import resolve_page_indices
+from src.utils.layout_templates import layout_fingerprint, TemplateVerdictCache
+from src.utils.token_estimator import (
+    estimate_image_tokens,
+    estimate_output_tokens,
+    estimate_max_tokens,
+    estimate_classifier_prompt_tokens,
+    estimate_extraction_prompt_tokens,
+)
 from src.parsers.pymupdf_parser import PyMuPDFParser
-from src.parsers.vlm_parser import VLMParser
+from src.parsers.vlm_parser import VLMParser, ExtractionError, TruncatedResponseError
+from src.handlers.hedge_handler import HedgedCaller
+from src.handlers.circuit_breaker import CircuitBreaker, is_service_failure
+from src.utils.usage_parser import merge_usage, split_usage
 from src.llm.bedrock_client import BedrockClient
 from src.output.writers import OutputWriter
+from src.processors.planner import plan_document, summarize_plan
+from src.processors.sharding import build_units, unit_output_dir
+from src.processors.requeue import DegradedRequeue
+from src.processors.workers import SharedState, SharedCircuitBreaker, init_worker, process_unit
 
 logger = logging.getLogger(__name__)
 
@@ -26,45 +64,109 @@ def select_parser(page_analysis: Dict[str, Any], has_tables: bool = False) -> st
         return "vlm"
     return "pymupdf"
 
+def find_pdf_files(dir_path: str) -> List[str]:
+    """Рекурсивно находит PDF файлы в директории (отсортированный список)."""
+    pdf_files = []
+    
+    for root, dirs, files in os.walk(dir_path):
+        for file in files:
+            if file.lower().endswith('.pdf'):
+                pdf_files.append(os.path.join(root, file))
+    
+    pdf_files.sort()
+    return pdf_files
+
 class PDFProcessor:
     """Процессор для обработки PDF файлов."""
     
-    def __init__(self, bedrock_client: Optional[BedrockClient] = None):
-        """Инициализация процессора."""
+    def __init__(
+        self,
+        bedrock_client: Optional[BedrockClient] = None,
+        budget: Optional[TokenBudget] = None,
+        document_max_cost_usd: Optional[float] = DOCUMENT_MAX_COST_USD,
+        document_max_tokens: Optional[int] = DOCUMENT_MAX_TOKENS,
+        hedge: bool = HEDGE_ENABLED,
+        batch_pages: int = VLM_BATCH_MAX_PAGES,
+        template_cache: bool = TEMPLATE_CACHE_ENABLED,
+        breaker: bool = BREAKER_ENABLED,
+        requeue: bool = BREAKER_REQUEUE_ENABLED
+    ):
+        """
+        Инициализация процессора.
+        budget - бюджет на весь запуск (общий для всех документов),
+        document_max_* - лимиты на один документ,
+        hedge - отправлять дубли медленных запросов к Bedrock,
+        batch_pages - максимум простых страниц в одном запросе к VLM (1 - без пакетов),
+        template_cache - переиспользовать вердикты классификатора для страниц одного шаблона
+        (кэш общий для всех документов запуска),
+        breaker - при устойчивых ошибках Bedrock обрабатывать страницы PyMuPDF (degraded),
+        requeue - повторно отправлять degraded страницы в VLM после восстановления Bedrock.
+        """
         self.bedrock_client = bedrock_client or BedrockClient()
         self.pymupdf_parser = PyMuPDFParser()
-        self.vlm_parser = VLMParser(self.bedrock_client)
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(enabled=breaker)
+        self.vlm_parser = VLMParser(
+            self.bedrock_client,
+            hedger=HedgedCaller(enabled=hedge),
+            breaker=self.breaker
+        )
+        self.budget = budget or TokenBudget(RUN_MAX_COST_USD, RUN_MAX_TOKENS)
+        self.document_max_cost_usd = document_max_cost_usd
+        self.document_max_tokens = document_max_tokens
+        self.batch_pages = batch_pages
+        self.template_cache = TemplateVerdictCache() if template_cache else None
+        self.requeue_enabled = requeue
+    
+    def set_breaker(self, breaker: CircuitBreaker) -> None:
+        """Заменяет circuit breaker процессора и VLM парсера."""
+        self.breaker = breaker
+        self.vlm_parser.breaker = breaker
     
     def process(
         self,
         pdf_path: str,
         output_dir: str,
         page_index: Optional[int] = None,
-        dpi: int = DEFAULT_DPI
+        dpi: int = DEFAULT_DPI,
+        pages: Optional[str] = None,
+        source: Optional[str] = None,
+        part: Optional[str] = None,
+        document_budget: Optional[TokenBudget] = None,
+        count_templates: bool = True
     ) -> Dict[str, Any]:
-        """Обрабатывает PDF файл и возвращает результаты."""
+        """
+        Обрабатывает PDF файл и возвращает результаты.
+        page_index - одна страница, pages - диапазоны вида "1-50,120,200-" (1-based),
+        source - путь файла относительно входной директории (по умолчанию - имя файла),
+        part - диапазон страниц, если результат - часть файла при шардировании (иначе None),
+        document_budget - бюджет документа (по умолчанию - новый с лимитами document_max_*),
+        count_templates - учитывать страницы в статистике кэша шаблонов.
+        """
         logger.info(f"Обработка PDF: {pdf_path}")
         
         pdf_doc = fitz.open(pdf_path)
         total_pages = len(pdf_doc)
         
-        if page_index is not None:
-            if page_index < 1 or page_index > total_pages:
-                logger.error(f"Номер страницы {page_index} вне диапазона [1, {total_pages}]")
-                pdf_doc.close()
-                return {}
-            page_indices = [page_index - 1]
-        else:
-            page_indices = list(range(total_pages))
+        page_indices = resolve_page_indices(total_pages, page_index=page_index, pages=pages)
+        if page_indices is None:
+            pdf_doc.close()
+            return {}
         
         zoom = dpi / 72.0
         mat = fitz.Matrix(zoom, zoom)
         
+        if document_budget is None:
+            document_budget = TokenBudget(
+                self.document_max_cost_usd,
+                self.document_max_tokens,
+                parent=self.budget
+            )
+        
         pages_data = []
         previous_page_text = ""
-        total_tokens = 0
-        total_time = 0.0
-        total_cost = 0.0
+        # Простые VLM страницы подряд, ожидающие пакетного извлечения
+        batch: List[Dict[str, Any]] = []
         
         for idx in page_indices:
             page = pdf_doc.load_page(idx)
@@ -78,6 +180,11 @@ class PDFProcessor:
             # Рендеринг изображения (если может понадобиться для VLM)
             pix = page.get_pixmap(matrix=mat)
             image_bytes = pix.tobytes("png")
+            image_tokens = estimate_image_tokens(pix.width, pix.height)
+            # Пиксельный буфер больше PNG в несколько раз - освобождаем сразу
+            del pix
+            fallback = None
+            degraded = False
             
             # Классификация через VLM для определения наличия таблиц/диаграмм
             # Если страница image-based или почти без текста, используем VLM без классификации
@@ -88,64 +195,224 @@ class PDFProcessor:
             # Это экономит токены, так как image-based страницы все равно требуют VLM
             should_classify = not analysis["has_almost_no_text"] and not analysis["is_image_based"]
             
+            # Страницы одного шаблона (счета, формы) получают подтвержденный вердикт без запроса
+            template = None
+            classifier_cached = False
+            if should_classify and self.template_cache is not None:
+                template = layout_fingerprint(page)
+                cached_verdict = self.template_cache.lookup(template, count=count_templates)
+                if cached_verdict is not None:
+                    has_tables = cached_verdict
+                    should_classify = False
+                    classifier_cached = True
+                    logger.info(f"Страница {page_num}: вердикт шаблона {template}, has_tables={has_tables}, классификация пропущена")
+            
+            # Bedrock недоступен (breaker разомкнут) - страница обрабатывается локально
+            if should_classify and not self.breaker.available():
+                should_classify = False
+                degraded = True
+            
+            classifier_prompt_tokens = estimate_classifier_prompt_tokens(image_tokens)
+            if should_classify and not document_budget.reserve(classifier_prompt_tokens, CLASSIFIER_MAX_TOKENS):
+                logger.warning(f"Страница {page_num}: бюджет исчерпан, классификация пропущена")
+                should_classify = False
+                fallback = "budget"
+            
             if should_classify:
                 logger.info(f"Страница {page_num}: запуск классификации (text_length={analysis['text_length']}, is_image_based={analysis['is_image_based']}, has_images={analysis['has_images']})")
+                classifier_extra = ExtraReservations(document_budget, classifier_prompt_tokens)
                 try:
-                    has_tables, classifier_usage = self.vlm_parser.classify_page(image_bytes)
+                    has_tables, classifier_usage = self.vlm_parser.classify_page(
+                        image_bytes,
+                        reserve=classifier_extra.reserve
+                    )
                     logger.info(f"Страница {page_num}: классификация завершена, has_tables={has_tables}, tokens={classifier_usage.get('total_tokens', 0)}")
                     time.sleep(0.2)  # Задержка между запросами
+                    document_budget.settle(classifier_prompt_tokens, CLASSIFIER_MAX_TOKENS, classifier_usage)
+                    if template is not None:
+                        self.template_cache.record(template, has_tables)
                 except Exception as e:
+                    document_budget.settle(classifier_prompt_tokens, CLASSIFIER_MAX_TOKENS, classifier_usage)
                     logger.warning(f"Ошибка классификации страницы {page_num}: {e}")
-                    # При ошибке классификации для подозрительных страниц используем VLM как fallback
-                    # Если страница имеет изображения, но мало текста, вероятно нужен VLM
-                    if analysis["has_images"] and analysis["text_length"] < 500:
+                    # Сбой сервиса - страница degraded (даже если breaker еще замкнут) и попадет в requeue.
+                    # Иначе для подозрительных страниц используем VLM как fallback:
+                    # если страница имеет изображения, но мало текста, вероятно нужен VLM
+                    if self._is_outage(e):
+                        degraded = True
+                    elif analysis["has_images"] and analysis["text_length"] < 500:
                         logger.info(f"Страница {page_num}: fallback на VLM из-за ошибки классификации")
                         has_tables = True
-            else:
+                finally:
+                    classifier_extra.release()
+            elif fallback is None and not classifier_cached and not degraded:
                 logger.info(f"Страница {page_num}: классификация пропущена (has_almost_no_text={analysis['has_almost_no_text']}, is_image_based={analysis['is_image_based']}, text_length={analysis['text_length']})")
             
             # Выбор парсера
             parser_type = select_parser(analysis, has_tables)
+            if degraded or (parser_type == "vlm" and not self.breaker.available()):
+                logger.warning(f"Страница {page_num}: Bedrock недоступен, страница обработана PyMuPDF (degraded)")
+                parser_type = "pymupdf"
+                fallback = "breaker"
+                degraded = True
+            
+            # Большие и очень плотные страницы извлекаются по тайлам
+            tile_columns = plan_tiles(page.rect, dpi, analysis["text_length"]) if parser_type == "vlm" else []
+            tile_count = sum(len(column) for column in tile_columns)
+            
+            # Простые страницы с небольшим ожидаемым выводом можно извлечь пакетом
+            expected_tokens = estimate_output_tokens(analysis)
+            batchable = (
+                parser_type == "vlm"
+                and not tile_count
+                and self.batch_pages > 1
+                and expected_tokens <= VLM_BATCH_PAGE_MAX_OUTPUT_TOKENS
+            )
+            batch_expected_tokens = sum(entry["expected_tokens"] for entry in batch)
+            if batch and (
+                not batchable
+                or len(batch) >= self.batch_pages
+                or batch_expected_tokens + expected_tokens > VLM_BATCH_MAX_OUTPUT_TOKENS
+            ):
+                previous_page_text = self._flush_batch(batch, previous_page_text, document_budget, pages_data)
+                batch = []
+            
+            if tile_columns:
+                tile_limits = self._plan_tile_limits(page, tile_columns, zoom, len(previous_page_text))
+                max_tokens = sum(limit for _, limit in tile_limits)
+                extraction_prompt_tokens = sum(prompt for prompt, _ in tile_limits)
+            else:
+                max_tokens = estimate_max_tokens(analysis)
+                extraction_prompt_tokens = estimate_extraction_prompt_tokens(image_tokens, len(previous_page_text))
+            
+            # Проверка бюджета перед извлечением через VLM: при исчерпании - PyMuPDF
+            if parser_type == "vlm" and not document_budget.reserve(extraction_prompt_tokens, max_tokens):
+                logger.warning(f"Страница {page_num}: бюджет исчерпан, VLM заменен на PyMuPDF")
+                parser_type = "pymupdf"
+                fallback = "budget"
+                tile_count = 0
+                batchable = False
+                if batch:
+                    previous_page_text = self._flush_batch(batch, previous_page_text, document_budget, pages_data)
+                    batch = []
+            
             logger.info(f"Страница {page_num}: выбран парсер {parser_type}")
             
+            if batchable:
+                batch.append({
+                    "page": page_num,
+                    "pdf_page": page,
+                    "image_bytes": image_bytes,
+                    "classifier_usage": classifier_usage,
+                    "template": template,
+                    "classifier_cached": classifier_cached,
+                    "fallback": fallback,
+                    "expected_tokens": expected_tokens,
+                    "max_tokens": max_tokens,
+                    "prompt_tokens": extraction_prompt_tokens,
+                })
+                continue
+            
             # Парсинг
             if parser_type == "pymupdf":
                 content, parser_usage, elapsed = self.pymupdf_parser.parse(page)
             else:
-                content, parser_usage, elapsed = self.vlm_parser.extract_text(image_bytes, previous_page_text)
-            
-            # Суммируем токены классификации и парсинга
-            total_page_tokens = classifier_usage.get("total_tokens", 0) + parser_usage.get("total_tokens", 0)
-            total_tokens += total_page_tokens
-            
-            total_time += elapsed
-            
-            # Учитываем токены классификации и парсинга при расчете стоимости
-            total_prompt_tokens = classifier_usage.get("prompt_tokens", 0) + parser_usage.get("prompt_tokens", 0)
-            total_completion_tokens = classifier_usage.get("completion_tokens", 0) + parser_usage.get("completion_tokens", 0)
-            page_cost = get_model_cost(total_prompt_tokens, total_completion_tokens)
-            total_cost += page_cost
-            
-            pages_data.append({
-                "page": page_num,
-                "parser": parser_type,
-                "tokens": total_page_tokens,
-                "classifier_tokens": classifier_usage.get("total_tokens", 0),
-                "parser_tokens": parser_usage.get("total_tokens", 0),
-                "time_sec": round(elapsed, 2),
-                "content": content,
-            })
+                parser_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                # Повтор с верхней границей max_tokens и дубли резервируются отдельно
+                if tile_count:
+                    extras = [ExtraReservations(document_budget, prompt) for prompt, _ in tile_limits]
+                else:
+                    extras = [ExtraReservations(document_budget, extraction_prompt_tokens)]
+                try:
+                    if tile_count:
+                        logger.info(f"Страница {page_num}: извлечение по {tile_count} тайлам")
+                        content, parser_usage, elapsed = self._extract_tiles(
+                            page,
+                            mat,
+                            tile_columns,
+                            [limit for _, limit in tile_limits],
+                            previous_page_text,
+                            reserves=[extra.reserve for extra in extras]
+                        )
+                    else:
+                        content, parser_usage, elapsed = self.vlm_parser.extract_text(
+                            image_bytes,
+                            previous_page_text,
+                            max_tokens=max_tokens,
+                            reserve=extras[0].reserve
+                        )
+                except Exception as e:
+                    if isinstance(e, ExtractionError):
+                        parser_usage = e.usage
+                    if isinstance(e, TruncatedResponseError):
+                        logger.warning(f"Страница {page_num}: ответ VLM обрезан, бюджет не позволяет повтор - PyMuPDF")
+                        fallback = "budget"
+                    elif not self._is_outage(e):
+                        raise
+                    else:
+                        logger.warning(f"Страница {page_num}: Bedrock недоступен, VLM заменен на PyMuPDF (degraded)")
+                        fallback = "breaker"
+                        degraded = True
+                    parser_type = "pymupdf"
+                    tile_count = 0
+                    content, _, elapsed = self.pymupdf_parser.parse(page)
+                finally:
+                    document_budget.settle(extraction_prompt_tokens, max_tokens, parser_usage)
+                    for extra in extras:
+                        extra.release()
+            image_bytes = None
+            
+            pages_data.append(self._page_record(
+                page_num,
+                parser_type,
+                classifier_usage,
+                parser_usage,
+                elapsed,
+                content,
+                tiles=tile_count,
+                template=template,
+                classifier_cached=classifier_cached,
+                fallback=fallback,
+                degraded=degraded
+            ))
             
             previous_page_text = content
         
+        if batch:
+            self._flush_batch(batch, previous_page_text, document_budget, pages_data)
+        
         pdf_doc.close()
         
+        file_name = os.path.basename(pdf_path)
+        return self._document_results(file_name, source or file_name, pages_data, part=part)
+    
+    def _is_outage(self, error: Exception) -> bool:
+        """
+        Сбой Bedrock (см. is_service_failure), после которого страница обрабатывается
+        PyMuPDF (degraded) даже при еще замкнутом breaker. С --no-breaker - никогда.
+        """
+        return self.breaker.enabled and is_service_failure(error)
+    
+    @staticmethod
+    def _document_results(
+        file_name: str,
+        source: str,
+        pages_data: List[Dict[str, Any]],
+        part: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Собирает результаты документа: итоги по страницам, метрики и содержимое."""
         return {
-            "file": os.path.basename(pdf_path),
-            "total_pages": len(page_indices),
-            "total_tokens": total_tokens,
-            "total_time_sec": round(total_time, 2),
-            "total_cost_usd": round(total_cost, 6),
+            "file": file_name,
+            "source": source,
+            "part": part,
+            "total_pages": len(pages_data),
+            "total_tokens": sum(p["tokens"] for p in pages_data),
+            "total_time_sec": round(sum(p["elapsed"] for p in pages_data), 2),
+            "total_cost_usd": round(sum(p["cost_usd"] for p in pages_data), 6),
+            "hedge_tokens": sum(p["hedge_tokens"] for p in pages_data),
+            "hedge_cost_usd": round(sum(p["hedge_cost_usd"] for p in pages_data), 6),
+            "classifier_calls_avoided": sum(1 for p in pages_data if p["classifier_cached"]),
+            "degraded_pages": sum(1 for p in pages_data if p["degraded"]),
+            "upgraded_pages": sum(1 for p in pages_data if p["upgraded"]),
             "pages": [
                 {
                     "page": p["page"],
@@ -154,45 +421,630 @@ class PDFProcessor:
                     "classifier_tokens": p.get("classifier_tokens", 0),
                     "parser_tokens": p.get("parser_tokens", 0),
                     "time_sec": p["time_sec"],
+                    "cost_usd": p["cost_usd"],
+                    "tiles": p["tiles"],
+                    "batched": p["batched"],
+                    "template": p["template"],
+                    "classifier_cached": p["classifier_cached"],
+                    "hedge_tokens": p["hedge_tokens"],
+                    "hedge_cost_usd": p["hedge_cost_usd"],
+                    "fallback": p["fallback"],
+                    "degraded": p["degraded"],
+                    "upgraded": p["upgraded"],
                 }
                 for p in pages_data
             ],
             "pages_content": pages_data,
         }
     
+    @staticmethod
+    def _page_record(
+        page_num: int,
+        parser_type: str,
+        classifier_usage: Dict[str, int],
+        parser_usage: Dict[str, int],
+        elapsed: float,
+        content: str,
+        tiles: int = 0,
+        batched: int = 0,
+        template: Optional[str] = None,
+        classifier_cached: bool = False,
+        fallback: Optional[str] = None,
+        degraded: bool = False
+    ) -> Dict[str, Any]:
+        """Собирает метрики и содержимое страницы (токены классификации и парсинга суммируются)."""
+        # Расход на дубли запросов (хеджирование) уже включен в токены и стоимость
+        page_usage = merge_usage(classifier_usage, parser_usage)
+        return {
+            "page": page_num,
+            "parser": parser_type,
+            "tokens": page_usage.get("total_tokens", 0),
+            "classifier_tokens": classifier_usage.get("total_tokens", 0),
+            "parser_tokens": parser_usage.get("total_tokens", 0),
+            "time_sec": round(elapsed, 2),
+            "elapsed": elapsed,
+            "cost_usd": get_model_cost(page_usage.get("prompt_tokens", 0), page_usage.get("completion_tokens", 0)),
+            "tiles": tiles,
+            "batched": batched,
+            "template": template,
+            "classifier_cached": classifier_cached,
+            "hedge_tokens": page_usage.get("hedge_tokens", 0),
+            "hedge_cost_usd": get_model_cost(
+                page_usage.get("hedge_prompt_tokens", 0),
+                page_usage.get("hedge_completion_tokens", 0)
+            ),
+            "fallback": fallback,
+            "degraded": degraded,
+            "upgraded": False,
+            "content": content,
+        }
+    
+    def _flush_batch(
+        self,
+        batch: List[Dict[str, Any]],
+        previous_page_text: str,
+        document_budget: TokenBudget,
+        pages_data: List[Dict[str, Any]]
+    ) -> str:
+        """
+        Извлекает накопленные страницы (см. _extract_batch_pages) и добавляет их в pages_data.
+        При сбое Bedrock неизвлеченные страницы обрабатываются PyMuPDF (degraded);
+        если бюджет не позволил повторить обрезанный ответ - PyMuPDF с fallback "budget".
+        Расход запросов, уже учтенный в бюджете, сохраняется в метриках этих страниц.
+        Возвращает текст последней страницы (контекст для следующей).
+        """
+        extracted_count = len(pages_data)
+        settled_usage: Dict[int, Dict[str, int]] = {}
+        try:
+            return self._extract_batch_pages(batch, previous_page_text, document_budget, pages_data, settled_usage)
+        except Exception as e:
+            truncated = isinstance(e, TruncatedResponseError)
+            if not truncated and not self._is_outage(e):
+                raise
+            extracted = {p["page"] for p in pages_data[extracted_count:]}
+            for entry in batch:
+                if entry["page"] in extracted:
+                    continue
+                if truncated:
+                    logger.warning(f"Страница {entry['page']}: бюджет не позволяет повтор VLM - PyMuPDF")
+                else:
+                    logger.warning(f"Страница {entry['page']}: Bedrock недоступен, VLM заменен на PyMuPDF (degraded)")
+                content, parser_usage, elapsed = self.pymupdf_parser.parse(entry["pdf_page"])
+                parser_usage = merge_usage(parser_usage, settled_usage.get(entry["page"], {}))
+                pages_data.append(self._page_record(
+                    entry["page"],
+                    "pymupdf",
+                    entry["classifier_usage"],
+                    parser_usage,
+                    elapsed,
+                    content,
+                    template=entry["template"],
+                    classifier_cached=entry["classifier_cached"],
+                    fallback="budget" if truncated else "breaker",
+                    degraded=not truncated
+                ))
+            return pages_data[-1]["content"]
+    
+    def _extract_batch_pages(
+        self,
+        batch: List[Dict[str, Any]],
+        previous_page_text: str,
+        document_budget: TokenBudget,
+        pages_data: List[Dict[str, Any]],
+        settled_usage: Dict[int, Dict[str, int]]
+    ) -> str:
+        """
+        Извлекает накопленные страницы одним запросом и добавляет их в pages_data.
+        Usage запроса делится между страницами: входные токены поровну, выходные -
+        пропорционально длине текста. Если ответ обрезан или не делится на страницы,
+        страницы извлекаются по одной, а расход пакетного запроса делится поровну.
+        При ошибке расход страниц, не попавших в pages_data, но учтенных в бюджете,
+        записывается в settled_usage (номер страницы -> usage).
+        Возвращает текст последней страницы (контекст для следующей).
+        """
+        if len(batch) == 1:
+            entry = batch[0]
+            parser_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            extra = ExtraReservations(document_budget, entry["prompt_tokens"])
+            try:
+                content, parser_usage, elapsed = self.vlm_parser.extract_text(
+                    entry["image_bytes"],
+                    previous_page_text,
+                    max_tokens=entry["max_tokens"],
+                    reserve=extra.reserve
+                )
+            except ExtractionError as e:
+                parser_usage = e.usage
+                settled_usage[entry["page"]] = parser_usage
+                raise
+            finally:
+                document_budget.settle(entry["prompt_tokens"], entry["max_tokens"], parser_usage)
+                extra.release()
+            pages_data.append(self._page_record(
+                entry["page"],
+                "vlm",
+                entry["classifier_usage"],
+                parser_usage,
+                elapsed,
+                content,
+                template=entry["template"],
+                classifier_cached=entry["classifier_cached"],
+                fallback=entry["fallback"]
+            ))
+            return content
+        
+        page_nums = [entry["page"] for entry in batch]
+        logger.info(f"Страницы {page_nums}: пакетное извлечение одним запросом")
+        max_tokens = min(
+            sum(entry["max_tokens"] for entry in batch),
+            VLM_EXTRACTION_MAX_TOKENS
+        )
+        batch_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        batch_extra = ExtraReservations(document_budget, sum(entry["prompt_tokens"] for entry in batch))
+        try:
+            texts, batch_usage, elapsed = self.vlm_parser.extract_batch(
+                [entry["image_bytes"] for entry in batch],
+                previous_page_text,
+                max_tokens=max_tokens,
+                reserve=batch_extra.reserve
+            )
+        except Exception:
+            for entry, share in zip(batch, split_usage(batch_usage, [1.0] * len(batch))):
+                document_budget.settle(entry["prompt_tokens"], entry["max_tokens"], share)
+                settled_usage[entry["page"]] = share
+            raise
+        finally:
+            batch_extra.release()
+        
+        if texts is not None:
+            weights = [len(text) + 1 for text in texts]
+            total_weight = sum(weights)
+            shares = split_usage(batch_usage, weights)
+            for entry, text, share, weight in zip(batch, texts, shares, weights):
+                document_budget.settle(entry["prompt_tokens"], entry["max_tokens"], share)
+                pages_data.append(self._page_record(
+                    entry["page"],
+                    "vlm",
+                    entry["classifier_usage"],
+                    share,
+                    elapsed * weight / total_weight,
+                    text,
+                    batched=len(batch),
+                    template=entry["template"],
+                    classifier_cached=entry["classifier_cached"],
+                    fallback=entry["fallback"]
+                ))
+            return texts[-1]
+        
+        # Пакет не удался - извлекаем по одной, учитывая уже потраченные токены
+        logger.warning(f"Страницы {page_nums}: пакетное извлечение не удалось, извлечение по одной")
+        shares = split_usage(batch_usage, [1.0] * len(batch))
+        for i, (entry, share) in enumerate(zip(batch, shares)):
+            parser_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            extra = ExtraReservations(document_budget, entry["prompt_tokens"])
+            try:
+                content, parser_usage, page_elapsed = self.vlm_parser.extract_text(
+                    entry["image_bytes"],
+                    previous_page_text,
+                    max_tokens=entry["max_tokens"],
+                    reserve=extra.reserve
+                )
+            except Exception as e:
+                if isinstance(e, ExtractionError):
+                    parser_usage = e.usage
+                settled_usage[entry["page"]] = merge_usage(share, parser_usage)
+                # Резервы оставшихся страниц освобождаются, расход пакета учитывается
+                for rest, rest_share in zip(batch[i + 1:], shares[i + 1:]):
+                    document_budget.settle(rest["prompt_tokens"], rest["max_tokens"], rest_share)
+                    settled_usage[rest["page"]] = rest_share
+                raise
+            finally:
+                parser_usage = merge_usage(share, parser_usage)
+                document_budget.settle(entry["prompt_tokens"], entry["max_tokens"], parser_usage)
+                extra.release()
+            pages_data.append(self._page_record(
+                entry["page"],
+                "vlm",
+                entry["classifier_usage"],
+                parser_usage,
+                elapsed / len(batch) + page_elapsed,
+                content,
+                template=entry["template"],
+                classifier_cached=entry["classifier_cached"],
+                fallback=entry["fallback"]
+            ))
+            previous_page_text = content
+        return previous_page_text
+    
+    def upgrade_degraded(
+        self,
+        pdf_path: str,
+        results: Dict[str, Any],
+        dpi: int = DEFAULT_DPI
+    ) -> Dict[str, Any]:
+        """
+        Повторно обрабатывает degraded страницы документа и заменяет те,
+        для которых запрос дошел до Bedrock (извлечение VLM или успешная классификация);
+        остальные остаются degraded. Расход обеих попыток сохраняется в метриках,
+        расход первой вычитается из лимитов документа; страницы повторно
+        не учитываются в статистике кэша шаблонов.
+        """
+        degraded_pages = [p["page"] for p in results["pages_content"] if p["degraded"]]
+        if not degraded_pages:
+            return results
+        
+        # Остаток бюджета документа после первой попытки
+        max_cost_usd, max_tokens = self.document_max_cost_usd, self.document_max_tokens
+        if max_cost_usd is not None:
+            max_cost_usd = max(0.0, max_cost_usd - results["total_cost_usd"])
+        if max_tokens is not None:
+            max_tokens = max(0, max_tokens - results["total_tokens"])
+        document_budget = TokenBudget(max_cost_usd, max_tokens, parent=self.budget)
+        
+        logger.info(f"{pdf_path}: повторная обработка degraded страниц {degraded_pages}")
+        retry = self.process(
+            pdf_path,
+            "",
+            dpi=dpi,
+            pages=",".join(str(n) for n in degraded_pages),
+            source=results["source"],
+            document_budget=document_budget,
+            count_templates=False
+        )
+        retried = {p["page"]: p for p in retry.get("pages_content", [])}
+        
+        pages_data = []
+        upgraded_count = 0
+        for page in results["pages_content"]:
+            retry_page = retried.get(page["page"])
+            if retry_page is None:
+                pages_data.append(page)
+                continue
+            # PyMuPDF без ответа Bedrock (бюджет, ошибка запроса) - не обновление
+            reached_bedrock = retry_page["parser"] == "vlm" or retry_page["classifier_tokens"] > 0
+            if retry_page["degraded"] or not reached_bedrock:
+                new_page, spent_page = dict(page), retry_page
+            else:
+                new_page, spent_page = retry_page, page
+                new_page["upgraded"] = True
+                upgraded_count += 1
+            for key in ("tokens", "classifier_tokens", "parser_tokens", "cost_usd", "hedge_tokens", "hedge_cost_usd", "elapsed"):
+                new_page[key] += spent_page[key]
+            new_page["time_sec"] = round(new_page["elapsed"], 2)
+            pages_data.append(new_page)
+        
+        logger.info(f"{pdf_path}: обновлено страниц {upgraded_count} из {len(degraded_pages)}")
+        return self._document_results(results["file"], results["source"], pages_data, part=results["part"])
+    
+    def _plan_tile_limits(
+        self,
+        page: fitz.Page,
+        tile_columns: List[List[fitz.Rect]],
+        zoom: float,
+        previous_text_length: int
+    ) -> List[Tuple[int, int]]:
+        """Оценивает (входные токены, max_tokens) для каждого тайла по его тексту и размеру."""
+        limits = []
+        first = True
+        for column in tile_columns:
+            for clip in column:
+                text_length = len((page.get_text("text", clip=clip) or "").strip())
+                tile_analysis = {
+                    "text_length": text_length,
+                    "has_almost_no_text": text_length < MIN_TEXT_LENGTH,
+                }
+                image_tokens = estimate_image_tokens(int(clip.width * zoom), int(clip.height * zoom))
+                prompt_tokens = estimate_extraction_prompt_tokens(
+                    image_tokens,
+                    previous_text_length if first else 0
+                )
+                limits.append((prompt_tokens, estimate_max_tokens(tile_analysis)))
+                first = False
+        return limits
+    
+    def _extract_tiles(
+        self,
+        page: fitz.Page,
+        mat: fitz.Matrix,
+        tile_columns: List[List[fitz.Rect]],
+        tile_max_tokens: List[int],
+        previous_page_text: str = "",
+        reserves: Optional[List[Callable[[int], bool]]] = None
+    ) -> Tuple[str, Dict[str, int], float]:
+        """
+        Извлекает текст страницы по тайлам параллельно и склеивает результат.
+        Рендеринг выполняется в текущем потоке: документ PyMuPDF не потокобезопасен.
+        При ошибке любого тайла бросает ExtractionError с расходом всех выполненных запросов
+        (TruncatedResponseError, если все ошибки - отказ бюджета в повторе).
+        reserves - резервирование дополнительных запросов по тайлам (см. VLMParser.extract_text).
+        """
+        start_time = time.time()
+        
+        tile_images = []
+        for column in tile_columns:
+            for clip in column:
+                pix = page.get_pixmap(matrix=mat, clip=clip)
+                tile_images.append(pix.tobytes("png"))
+                del pix
+        
+        reserves = reserves or [None] * len(tile_images)
+        with ThreadPoolExecutor(max_workers=TILE_CONCURRENCY) as executor:
+            futures = [
+                executor.submit(
+                    self.vlm_parser.extract_text,
+                    image,
+                    previous_page_text if i == 0 else "",
+                    max_tokens=max_tokens,
+                    reserve=reserve
+                )
+                for i, (image, max_tokens, reserve) in enumerate(zip(tile_images, tile_max_tokens, reserves))
+            ]
+            # Ждем все тайлы: расход успешных учитывается и при ошибке одного из них
+            results, errors = [], []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+        
+        usage = merge_usage(
+            *(tile_usage for _, tile_usage, _ in results),
+            *(e.usage for e in errors if isinstance(e, ExtractionError))
+        )
+        if errors:
+            message = f"Ошибка извлечения {len(errors)} из {len(futures)} тайлов: {errors[0]}"
+            failures = [e for e in errors if not isinstance(e, TruncatedResponseError)]
+            if not failures:
+                raise TruncatedResponseError(message, usage)
+            raise ExtractionError(message, usage) from failures[0]
+        
+        texts = iter(text for text, _, _ in results)
+        columns = [[next(texts) for _ in column] for column in tile_columns]
+        return stitch_tiles(columns), usage, time.time() - start_time
+    
     def process_directory(
         self,
         dir_path: str,
         output_base_dir: str,
-        page_index: Optional[int] = None
+        page_index: Optional[int] = None,
+        concurrency: int = MAX_CONCURRENCY,
+        writer: Optional[Any] = None,
+        pages: Optional[str] = None,
+        shard: Optional[Tuple[int, int]] = None
     ) -> None:
-        """Обрабатывает все PDF файлы в директории."""
-        pdf_files = []
-        
-        for root, dirs, files in os.walk(dir_path):
-            for file in files:
-                if file.lower().endswith('.pdf'):
-                    pdf_files.append(os.path.join(root, file))
-        
-        pdf_files.sort()
+        """
+        Обрабатывает все PDF файлы в директории.
+        При concurrency > 1 документы обрабатываются параллельно в отдельных
+        процессах, самые дорогие по предварительному плану запускаются первыми.
+        writer - объект с методом write_outputs (по умолчанию OutputWriter,
+        результаты каждого PDF пишутся в свою поддиректорию).
+        shard - (i, N): обработать только задания i-го из N узлов.
+        """
+        pdf_files = find_pdf_files(dir_path)
         
         if not pdf_files:
             logger.warning(f"PDF файлы не найдены в {dir_path}")
             return
         
         logger.info(f"Найдено {len(pdf_files)} PDF файлов")
+        self.process_files(
+            pdf_files,
+            output_base_dir,
+            page_index=page_index,
+            concurrency=concurrency,
+            writer=writer,
+            pages=pages,
+            shard=shard,
+            root=dir_path
+        )
+    
+    def process_files(
+        self,
+        pdf_files: List[str],
+        output_base_dir: str,
+        page_index: Optional[int] = None,
+        concurrency: int = MAX_CONCURRENCY,
+        writer: Optional[Any] = None,
+        pages: Optional[str] = None,
+        shard: Optional[Tuple[int, int]] = None,
+        root: Optional[str] = None
+    ) -> None:
+        """
+        Обрабатывает список PDF файлов (см. process_directory).
+        При шардировании большие файлы делятся на части, которые пишутся
+        в <pdf>/parts/<диапазон>/ и собираются командой merge.
+        """
+        writer = writer or OutputWriter()
+        requeue = DegradedRequeue(self, writer) if self.requeue_enabled else None
+        
+        units = build_units(pdf_files, page_index=page_index, pages=pages, shard=shard, root=root)
+        if shard:
+            logger.info(f"Шард {shard[0]}/{shard[1]}: {len(units)} заданий")
+        
+        try:
+            self._process_units(units, output_base_dir, writer, requeue, page_index, concurrency)
+        finally:
+            if requeue is not None:
+                requeue.close()
+    
+    def _process_units(
+        self,
+        units: List[Dict[str, Any]],
+        output_base_dir: str,
+        writer: Any,
+        requeue: Optional[DegradedRequeue],
+        page_index: Optional[int] = None,
+        concurrency: int = MAX_CONCURRENCY
+    ) -> None:
+        """Обрабатывает задания последовательно или параллельно (самые дорогие по плану первыми)."""
+        if concurrency <= 1:
+            for unit in units:
+                self._process_to_output(unit, output_base_dir, writer, requeue, page_index)
+            return
+        
+        documents = []
+        for unit in units:
+            document_plan = plan_document(unit["path"], page_index=page_index, pages=unit["pages"])
+            if document_plan:
+                document_plan["unit"] = unit
+                documents.append(document_plan)
+        plan = summarize_plan(documents, concurrency)
+        planned = sorted(plan["documents"], key=lambda d: d["time_sec"], reverse=True)
+        logger.info(
+            f"План: {plan['vlm_pages']} VLM страниц из {plan['total_pages']}, "
+            f"~${plan['cost_usd']}, ~{plan['wall_time_sec']} сек при concurrency={concurrency}"
+        )
+        
+        self._process_units_in_workers(
+            [document_plan["unit"] for document_plan in planned],
+            output_base_dir,
+            writer,
+            requeue,
+            page_index,
+            concurrency
+        )
+    
+    def _worker_options(self) -> Dict[str, Any]:
+        """Параметры PDFProcessor для процессов-обработчиков (клиент Bedrock передается через pickle)."""
+        return {
+            "bedrock_client": self.bedrock_client,
+            "document_max_cost_usd": self.document_max_cost_usd,
+            "document_max_tokens": self.document_max_tokens,
+            "hedge": self.hedge,
+            "batch_pages": self.batch_pages,
+            "breaker": self.breaker.enabled,
+        }
+    
+    def _process_units_in_workers(
+        self,
+        units: List[Dict[str, Any]],
+        output_base_dir: str,
+        writer: Any,
+        requeue: Optional[DegradedRequeue],
+        page_index: Optional[int],
+        concurrency: int
+    ) -> None:
+        """
+        Обрабатывает задания в отдельных процессах: PyMuPDF не поддерживает
+        работу из нескольких потоков. Бюджет запуска, кэш шаблонов и состояние
+        circuit breaker на время обработки переносятся в процесс-менеджер, затем
+        расход, кластеры и состояние breaker возвращаются в процессор, а счетчики
+        хеджирования обработчиков добавляются к счетчикам процессора. Результаты
+        записываются в текущем процессе в порядке завершения.
+        """
+        ctx = multiprocessing.get_context("spawn")
+        local_budget, local_cache, local_breaker = self.budget, self.template_cache, self.breaker
+        max_cost_usd, max_tokens = local_budget.limits_left()
         
-        for pdf_path in pdf_files:
+        with SharedState(ctx=ctx) as manager:
+            shared_budget = manager.TokenBudget(max_cost_usd, max_tokens)
+            shared_cache = None
+            if local_cache is not None:
+                shared_cache = manager.TemplateVerdictCache(local_cache.min_confirmations)
+                shared_cache.load(local_cache.state())
+            shared_breaker = manager.CircuitBreaker(
+                local_breaker.enabled,
+                local_breaker.failure_threshold,
+                local_breaker.reset_timeout_sec
+            )
+            shared_breaker.restore(local_breaker.snapshot())
+            # Повторная обработка degraded страниц в этом процессе тоже идет через общее состояние
+            self.budget, self.template_cache = shared_budget, shared_cache
+            self.set_breaker(SharedCircuitBreaker(shared_breaker, local_breaker.enabled))
             try:
-                pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-                pdf_output_dir = os.path.join(output_base_dir, pdf_name)
-                os.makedirs(pdf_output_dir, exist_ok=True)
-                
-                results = self.process(pdf_path, pdf_output_dir, page_index=page_index)
-                if results:
-                    from src.output.writers import OutputWriter
-                    writer = OutputWriter()
-                    writer.write_outputs(results, pdf_output_dir)
-            except Exception as e:
-                logger.error(f"Ошибка обработки {pdf_path}: {e}")
-
+                with ProcessPoolExecutor(
+                    max_workers=concurrency,
+                    mp_context=ctx,
+                    initializer=init_worker,
+                    initargs=(self._worker_options(), shared_budget, shared_cache, shared_breaker)
+                ) as executor:
+                    futures = {
+                        executor.submit(process_unit, unit, unit_output_dir(output_base_dir, unit), page_index): unit
+                        for unit in units
+                    }
+                    for future in as_completed(futures):
+                        unit = futures[future]
+                        pdf_output_dir = unit_output_dir(output_base_dir, unit)
+                        try:
+                            results, hedge_stats = future.result()
+                            self.vlm_parser.hedger.merge_stats(hedge_stats)
+                            self._deliver(unit["path"], pdf_output_dir, results, writer, requeue)
+                        except Exception as e:
+                            logger.error(f"Ошибка обработки {unit['path']}: {e}")
+            finally:
+                self.budget, self.template_cache = local_budget, local_cache
+                self.set_breaker(local_breaker)
+                local_budget.charge(*shared_budget.spent())
+                if local_cache is not None:
+                    local_cache.load(shared_cache.state())
+                local_breaker.restore(shared_breaker.snapshot())
+    
+    def _process_to_output(
+        self,
+        unit: Dict[str, Any],
+        output_base_dir: str,
+        writer: Any,
+        requeue: Optional[DegradedRequeue] = None,
+        page_index: Optional[int] = None
+    ) -> None:
+        """
+        Обрабатывает одно задание (PDF файл или его часть) и записывает результаты через writer.
+        Документы с degraded страницами передаются в requeue и записываются после повторной обработки.
+        """
+        pdf_path = unit["path"]
+        try:
+            pdf_output_dir = unit_output_dir(output_base_dir, unit)
+            
+            results = self.process(
+                pdf_path,
+                pdf_output_dir,
+                page_index=page_index,
+                pages=unit["pages"],
+                source=unit["source"],
+                part=unit["pages"] if unit["part"] else None
+            )
+            self._deliver(pdf_path, pdf_output_dir, results, writer, requeue)
+        except Exception as e:
+            logger.error(f"Ошибка обработки {pdf_path}: {e}")
+    
+    @staticmethod
+    def _deliver(
+        pdf_path: str,
+        output_dir: str,
+        results: Dict[str, Any],
+        writer: Any,
+        requeue: Optional[DegradedRequeue]
+    ) -> None:
+        """
+        Записывает результаты или передает документ с degraded страницами в requeue.
+        Между документами очередь requeue обрабатывается в текущем потоке.
+        """
+        if results and results["degraded_pages"] and requeue is not None:
+            requeue.put(pdf_path, output_dir, results)
+        elif results:
+            writer.write_outputs(results, output_dir)
+        if requeue is not None:
+            requeue.drain()
+    
+    def process_file(
+        self,
+        pdf_path: str,
+        output_dir: str,
+        writer: Optional[Any] = None,
+        page_index: Optional[int] = None,
+        pages: Optional[str] = None
+    ) -> None:
+        """
+        Обрабатывает один PDF и записывает результаты прямо в output_dir.
+        Degraded страницы повторно обрабатываются после восстановления Bedrock.
+        """
+        writer = writer or OutputWriter()
+        results = self.process(pdf_path, output_dir, page_index=page_index, pages=pages)
+        if not results:
+            return
+        if results["degraded_pages"] and self.requeue_enabled:
+            requeue = DegradedRequeue(self, writer)
+            requeue.put(pdf_path, output_dir, results)
+            requeue.close()
+        else:
+            writer.write_outputs(results, output_dir)
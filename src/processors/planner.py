@@ -0,0 +1,191 @@
+"""Предварительное планирование обработки PDF (dry-run)."""
+import os
+import heapq
+import logging
+import fitz
+from typing import Dict, Any, List, Optional
+
+from config.settings import (
+    DEFAULT_DPI,
+    MAX_CONCURRENCY,
+    REQUEST_DELAY,
+    CLASSIFIER_OUTPUT_TOKENS,
+    VLM_OUTPUT_TOKENS_PER_SEC,
+    VLM_REQUEST_OVERHEAD_SEC,
+    PYMUPDF_SEC_PER_PAGE,
+    TABLE_DRAWINGS_THRESHOLD,
+    TILE_CONCURRENCY,
+)
+from src.utils.page_analyzer import analyze_page
+from src.utils.cost_calculator import get_model_cost
+from src.utils.tiling import plan_tiles
+from src.utils.page_ranges import resolve_page_indices
+from src.utils.token_estimator import (
+    estimate_image_tokens,
+    estimate_page_image_tokens,
+    estimate_output_tokens,
+    estimate_classifier_prompt_tokens,
+    estimate_extraction_prompt_tokens,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _vlm_call_time(output_tokens: int) -> float:
+    """Оценивает время одного запроса к VLM в секундах."""
+    return VLM_REQUEST_OVERHEAD_SEC + output_tokens / VLM_OUTPUT_TOKENS_PER_SEC + REQUEST_DELAY
+
+
+def likely_has_table_or_diagram(page: fitz.Page) -> bool:
+    """Локальная эвристика вместо классификатора: много векторной графики - вероятно таблица."""
+    return len(page.get_drawings()) >= TABLE_DRAWINGS_THRESHOLD
+
+
+def plan_page(
+    page: fitz.Page,
+    dpi: int = DEFAULT_DPI,
+    previous_text_length: int = 0
+) -> Dict[str, Any]:
+    """
+    Строит план обработки одной страницы без рендеринга и сетевых запросов.
+    Возвращает ожидаемый маршрут, токены, стоимость и время.
+    """
+    analysis = analyze_page(page)
+    image_tokens = estimate_page_image_tokens(page.rect, dpi)
+
+    should_classify = not analysis["has_almost_no_text"] and not analysis["is_image_based"]
+
+    prompt_tokens = 0
+    output_tokens = 0
+    time_sec = 0.0
+
+    if should_classify:
+        prompt_tokens += estimate_classifier_prompt_tokens(image_tokens)
+        output_tokens += CLASSIFIER_OUTPUT_TOKENS
+        time_sec += _vlm_call_time(CLASSIFIER_OUTPUT_TOKENS)
+        route = "vlm" if likely_has_table_or_diagram(page) else "pymupdf"
+    else:
+        route = "vlm"
+
+    tiles = []
+    if route == "vlm":
+        extraction_output = estimate_output_tokens(analysis)
+        tiles = [clip for column in plan_tiles(page.rect, dpi, analysis["text_length"]) for clip in column]
+        if tiles:
+            # Тайлы извлекаются параллельно пачками по TILE_CONCURRENCY
+            zoom = dpi / 72.0
+            for i, clip in enumerate(tiles):
+                tile_image_tokens = estimate_image_tokens(int(clip.width * zoom), int(clip.height * zoom))
+                prompt_tokens += estimate_extraction_prompt_tokens(
+                    tile_image_tokens,
+                    previous_text_length if i == 0 else 0
+                )
+            waves = -(-len(tiles) // TILE_CONCURRENCY)
+            time_sec += waves * _vlm_call_time(extraction_output // len(tiles))
+        else:
+            prompt_tokens += estimate_extraction_prompt_tokens(image_tokens, previous_text_length)
+            time_sec += _vlm_call_time(extraction_output)
+        output_tokens += extraction_output
+    else:
+        time_sec += PYMUPDF_SEC_PER_PAGE
+
+    return {
+        "page": page.number + 1,
+        "route": route,
+        "classify": should_classify,
+        "tiles": len(tiles),
+        "text_length": analysis["text_length"],
+        "image_tokens": image_tokens,
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": get_model_cost(prompt_tokens, output_tokens),
+        "time_sec": round(time_sec, 2),
+    }
+
+
+def plan_document(
+    pdf_path: str,
+    page_index: Optional[int] = None,
+    dpi: int = DEFAULT_DPI,
+    pages: Optional[str] = None
+) -> Dict[str, Any]:
+    """Строит план обработки PDF файла. Возвращает пустой словарь при ошибке."""
+    try:
+        pdf_doc = fitz.open(pdf_path)
+    except Exception as e:
+        logger.error(f"Не удалось открыть {pdf_path}: {e}")
+        return {}
+
+    page_indices = resolve_page_indices(len(pdf_doc), page_index=page_index, pages=pages)
+    if page_indices is None:
+        pdf_doc.close()
+        return {}
+
+    page_plans = []
+    previous_text_length = 0
+    for idx in page_indices:
+        page = pdf_doc.load_page(idx)
+        page_plan = plan_page(page, dpi, previous_text_length)
+        page_plans.append(page_plan)
+        previous_text_length = page_plan["text_length"]
+
+    pdf_doc.close()
+
+    return {
+        "file": os.path.basename(pdf_path),
+        "path": pdf_path,
+        "page_range": pages,
+        "total_pages": len(page_plans),
+        "vlm_pages": sum(1 for p in page_plans if p["route"] == "vlm"),
+        "pymupdf_pages": sum(1 for p in page_plans if p["route"] == "pymupdf"),
+        "classifier_calls": sum(1 for p in page_plans if p["classify"]),
+        "prompt_tokens": sum(p["prompt_tokens"] for p in page_plans),
+        "output_tokens": sum(p["output_tokens"] for p in page_plans),
+        "cost_usd": round(sum(p["cost_usd"] for p in page_plans), 6),
+        "time_sec": round(sum(p["time_sec"] for p in page_plans), 2),
+        "pages": page_plans,
+    }
+
+
+def estimate_wall_time(durations: List[float], concurrency: int) -> float:
+    """
+    Оценивает общее время при параллельной обработке.
+    Задачи распределяются от самых долгих к коротким на наименее загруженный воркер.
+    """
+    workers = [0.0] * max(1, concurrency)
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(workers, workers[0] + duration)
+    return max(workers)
+
+
+def summarize_plan(documents: List[Dict[str, Any]], concurrency: int = MAX_CONCURRENCY) -> Dict[str, Any]:
+    """Сводит планы документов в общий план запуска."""
+    return {
+        "total_documents": len(documents),
+        "total_pages": sum(d["total_pages"] for d in documents),
+        "vlm_pages": sum(d["vlm_pages"] for d in documents),
+        "pymupdf_pages": sum(d["pymupdf_pages"] for d in documents),
+        "classifier_calls": sum(d["classifier_calls"] for d in documents),
+        "prompt_tokens": sum(d["prompt_tokens"] for d in documents),
+        "output_tokens": sum(d["output_tokens"] for d in documents),
+        "cost_usd": round(sum(d["cost_usd"] for d in documents), 6),
+        "concurrency": concurrency,
+        "wall_time_sec": round(estimate_wall_time([d["time_sec"] for d in documents], concurrency), 2),
+        "documents": documents,
+    }
+
+
+def plan_files(
+    pdf_paths: List[str],
+    page_index: Optional[int] = None,
+    dpi: int = DEFAULT_DPI,
+    concurrency: int = MAX_CONCURRENCY,
+    pages: Optional[str] = None
+) -> Dict[str, Any]:
+    """Строит общий план обработки для списка PDF файлов."""
+    documents = []
+    for pdf_path in pdf_paths:
+        document_plan = plan_document(pdf_path, page_index=page_index, dpi=dpi, pages=pages)
+        if document_plan:
+            documents.append(document_plan)
+    return summarize_plan(documents, concurrency)
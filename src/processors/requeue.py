@@ -0,0 +1,101 @@
+"""Повторная обработка degraded страниц после восстановления Bedrock."""
+import time
+import logging
+from typing import Dict, Any, List
+
+from config.settings import BREAKER_REQUEUE_MAX_WAIT_SEC
+
+logger = logging.getLogger(__name__)
+
+
+class DegradedRequeue:
+    """
+    Очередь документов с degraded страницами.
+
+    Очередь обрабатывается в вызывающем потоке (PyMuPDF не поддерживает работу
+    из нескольких потоков): drain() вызывается между документами и повторно
+    обрабатывает degraded страницы через processor.upgrade_degraded, если circuit
+    breaker пропускает запросы; close() ждет восстановления Bedrock. Документ
+    записывается через writer один раз: после успешного обновления всех страниц
+    или при закрытии очереди (тогда degraded страницы остаются как есть).
+    """
+
+    def __init__(self, processor: Any, writer: Any, max_wait_sec: float = BREAKER_REQUEUE_MAX_WAIT_SEC):
+        """processor - PDFProcessor, writer - объект с методом write_outputs."""
+        self.processor = processor
+        self.writer = writer
+        self.max_wait_sec = max_wait_sec
+        self._items: List[Dict[str, Any]] = []
+
+    def put(self, pdf_path: str, output_dir: str, results: Dict[str, Any]) -> None:
+        """Ставит документ в очередь на повторную обработку degraded страниц."""
+        self._items.append({"path": pdf_path, "output_dir": output_dir, "results": results})
+        logger.info(f"{pdf_path}: {results['degraded_pages']} degraded страниц поставлено в очередь")
+
+    def drain(self) -> None:
+        """
+        Повторно обрабатывает документы очереди, пока breaker пропускает запросы.
+        Каждый документ обрабатывается не больше одного раза за вызов.
+        """
+        items, self._items = self._items, []
+        for i, item in enumerate(items):
+            if self.processor.breaker.retry_after() > 0:
+                self._items = items[i:] + self._items
+                return
+            self._upgrade(item)
+
+    def _upgrade(self, item: Dict[str, Any]) -> None:
+        """
+        Обрабатывает документ; если degraded страницы остались - возвращает его в очередь.
+        Документ без обновленных страниц при доступном Bedrock (бюджет, ошибки запроса)
+        больше не повторяется.
+        """
+        try:
+            results = self.processor.upgrade_degraded(item["path"], item["results"])
+        except Exception as e:
+            logger.error(f"Ошибка повторной обработки {item['path']}: {e}")
+            results = item["results"]
+            # Ошибка не связана с доступностью Bedrock - больше не повторяем
+            if self.processor.breaker.available():
+                self._write(item, results)
+                return
+        stalled = results["degraded_pages"] == item["results"]["degraded_pages"]
+        if results["degraded_pages"] and not (stalled and self.processor.breaker.available()):
+            self._items.append({**item, "results": results})
+            return
+        self._write(item, results)
+
+    def _write(self, item: Dict[str, Any], results: Dict[str, Any]) -> None:
+        """Записывает результаты документа."""
+        try:
+            self.writer.write_outputs(results, item["output_dir"])
+        except Exception as e:
+            logger.error(f"Ошибка записи {item['path']}: {e}")
+
+    def close(self) -> None:
+        """
+        Ждет обработки очереди не дольше max_wait_sec, затем записывает
+        оставшиеся документы с degraded страницами.
+        """
+        deadline = time.time() + self.max_wait_sec
+        if self._items:
+            logger.info(
+                f"Ожидание восстановления Bedrock для {len(self._items)} документов "
+                f"(не дольше {self.max_wait_sec:.0f}s)"
+            )
+        while self._items:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            delay = self.processor.breaker.retry_after()
+            if delay > 0:
+                time.sleep(min(delay, remaining))
+                continue
+            self.drain()
+
+        remaining_items, self._items = self._items, []
+        for item in remaining_items:
+            logger.warning(
+                f"{item['path']}: {item['results']['degraded_pages']} страниц остались degraded"
+            )
+            self._write(item, item["results"])
@@ -0,0 +1,115 @@
+"""Детерминированное распределение работы между узлами (--shard i/N)."""
+import os
+import hashlib
+import logging
+import fitz
+from typing import Dict, Any, List, Optional, Tuple
+
+from config.settings import SHARD_SPLIT_PAGES, SHARD_CHUNK_PAGES
+from src.utils.page_ranges import format_page_range
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Разбирает "i/N" (i от 0 до N-1). Бросает ValueError при некорректной записи."""
+    try:
+        index_str, count_str = spec.split("/", 1)
+        shard_index, shard_count = int(index_str), int(count_str)
+    except ValueError:
+        raise ValueError(f"Некорректный шард '{spec}', ожидается i/N")
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"Некорректный шард '{spec}': i должен быть в [0, N-1]")
+    return shard_index, shard_count
+
+
+def shard_for_key(key: str, shard_count: int) -> int:
+    """Номер шарда для ключа. Стабилен между процессами и машинами (в отличие от hash())."""
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return int(digest, 16) % shard_count
+
+
+def source_key(pdf_path: str, root: Optional[str] = None) -> str:
+    """Путь файла относительно root (или имя файла) с разделителем "/": ключ шарда и путь результатов."""
+    key = os.path.relpath(pdf_path, root) if root else os.path.basename(pdf_path)
+    return key.replace(os.sep, "/")
+
+
+def _count_pages(pdf_path: str) -> int:
+    """Количество страниц PDF или 0, если файл не открывается."""
+    try:
+        with fitz.open(pdf_path) as pdf_doc:
+            return len(pdf_doc)
+    except Exception as e:
+        logger.warning(f"Не удалось открыть {pdf_path}: {e}")
+        return 0
+
+
+def plan_shard(
+    pdf_paths: List[str],
+    shard_index: int,
+    shard_count: int,
+    root: Optional[str] = None,
+    split_pages: int = SHARD_SPLIT_PAGES,
+    chunk_pages: int = SHARD_CHUNK_PAGES
+) -> List[Dict[str, Any]]:
+    """
+    Возвращает задания шарда: {"path", "source", "pages", "part"}.
+
+    Ключ файла - путь относительно root, поэтому узлы с разными точками монтирования
+    получают одинаковое разбиение. Файлы длиннее split_pages делятся на части
+    по chunk_pages страниц, каждая часть распределяется отдельно (part=True).
+    split_pages=0 отключает деление файлов.
+    """
+    units = []
+    for pdf_path in pdf_paths:
+        key = source_key(pdf_path, root)
+
+        total_pages = _count_pages(pdf_path) if split_pages else 0
+        if total_pages <= split_pages or not split_pages:
+            if shard_for_key(key, shard_count) == shard_index:
+                units.append({"path": pdf_path, "source": key, "pages": None, "part": False})
+            continue
+
+        for start in range(1, total_pages + 1, chunk_pages):
+            end = min(start + chunk_pages - 1, total_pages)
+            pages = format_page_range(start, end)
+            if shard_for_key(f"{key}#{pages}", shard_count) == shard_index:
+                units.append({"path": pdf_path, "source": key, "pages": pages, "part": True})
+    return units
+
+
+def build_units(
+    pdf_paths: List[str],
+    page_index: Optional[int] = None,
+    pages: Optional[str] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    root: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Формирует задания запуска. Без шардирования - по одному на файл.
+    Явный выбор страниц (page_index/pages) отключает деление файлов на части.
+    """
+    if not shard:
+        return [
+            {"path": pdf_path, "source": source_key(pdf_path, root), "pages": pages, "part": False}
+            for pdf_path in pdf_paths
+        ]
+
+    split_pages = 0 if page_index is not None or pages else SHARD_SPLIT_PAGES
+    units = plan_shard(pdf_paths, shard[0], shard[1], root=root, split_pages=split_pages)
+    for unit in units:
+        if not unit["part"]:
+            unit["pages"] = pages
+    return units
+
+
+def unit_output_dir(output_base_dir: str, unit: Dict[str, Any]) -> str:
+    """
+    Директория результатов задания: <pdf>/ или <pdf>/parts/<диапазон>/ для частей файла,
+    где <pdf> - путь файла относительно входной директории без расширения.
+    """
+    pdf_name = os.path.join(*os.path.splitext(unit["source"])[0].split("/"))
+    if unit.get("part"):
+        return os.path.join(output_base_dir, pdf_name, "parts", unit["pages"])
+    return os.path.join(output_base_dir, pdf_name)
@@ -0,0 +1,123 @@
+"""
+Обработка документов в отдельных процессах.
+
+PyMuPDF не поддерживает работу из нескольких потоков (даже с разными документами),
+поэтому параллельная обработка документов (--concurrency > 1) выполняется
+в процессах-обработчиках. Бюджет запуска, кэш шаблонов разметки и состояние
+circuit breaker на это время хранятся в процессе-менеджере и доступны
+обработчикам через прокси.
+"""
+import logging
+from multiprocessing.managers import BaseManager
+from typing import Dict, Any, Optional, Tuple
+
+from src.handlers.circuit_breaker import CircuitBreaker
+from src.utils.budget import TokenBudget
+from src.utils.layout_templates import TemplateVerdictCache
+
+logger = logging.getLogger(__name__)
+
+# Процессор текущего процесса-обработчика (создается в init_worker)
+_processor = None
+
+
+class SharedState(BaseManager):
+    """Менеджер общего состояния запуска: бюджет, кэш шаблонов и circuit breaker."""
+
+
+SharedState.register("TokenBudget", TokenBudget)
+SharedState.register("TemplateVerdictCache", TemplateVerdictCache)
+# call() выполняет запрос и не может работать через прокси - см. SharedCircuitBreaker
+SharedState.register(
+    "CircuitBreaker",
+    CircuitBreaker,
+    exposed=("_allow", "_record_success", "_record_failure", "retry_after", "snapshot", "restore", "stats")
+)
+
+
+class SharedCircuitBreaker(CircuitBreaker):
+    """
+    Circuit breaker, состояние которого хранится в общем breaker процесса-менеджера:
+    сбои, замеченные одним процессом, размыкают breaker для всех. Запрос
+    выполняется в вызывающем процессе.
+    """
+
+    def __init__(self, shared: Any, enabled: bool):
+        """shared - прокси CircuitBreaker из SharedState."""
+        self.enabled = enabled
+        self._shared = shared
+
+    def _allow(self) -> bool:
+        """Разрешает вызов (см. CircuitBreaker._allow)."""
+        return self._shared._allow()
+
+    def _record_success(self) -> None:
+        """Учитывает успешный вызов."""
+        self._shared._record_success()
+
+    def _record_failure(self) -> None:
+        """Учитывает неудачную попытку."""
+        self._shared._record_failure()
+
+    def retry_after(self) -> float:
+        """Секунды до пропуска вызова по общему состоянию."""
+        return self._shared.retry_after()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Копия общего состояния."""
+        return self._shared.snapshot()
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """Заменяет общее состояние."""
+        self._shared.restore(snapshot)
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика общего breaker."""
+        return self._shared.stats()
+
+
+def init_worker(
+    options: Dict[str, Any],
+    budget: Any,
+    template_cache: Optional[Any],
+    breaker: Any
+) -> None:
+    """
+    Инициализация процесса-обработчика: клиент Bedrock процессора запуска (пересоздается
+    при десериализации), общие бюджет, кэш шаблонов и состояние breaker.
+    Повторная обработка degraded страниц выполняется в основном процессе.
+    """
+    global _processor
+    # Импорт здесь: pdf_processor сам импортирует этот модуль
+    from src.processors.pdf_processor import PDFProcessor
+
+    _processor = PDFProcessor(budget=budget, template_cache=False, requeue=False, **options)
+    _processor.template_cache = template_cache
+    _processor.set_breaker(SharedCircuitBreaker(breaker, _processor.breaker.enabled))
+
+
+def process_unit(
+    unit: Dict[str, Any],
+    output_dir: str,
+    page_index: Optional[int] = None
+) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """
+    Обрабатывает одно задание в процессе-обработчике.
+    Возвращает (результаты, счетчики хеджирования задания); при ошибке результаты пустые.
+    """
+    hedger = _processor.vlm_parser.hedger
+    before = hedger.stats()
+    try:
+        results = _processor.process(
+            unit["path"],
+            output_dir,
+            page_index=page_index,
+            pages=unit["pages"],
+            source=unit["source"],
+            part=unit["pages"] if unit["part"] else None
+        )
+    except Exception as e:
+        logger.error(f"Ошибка обработки {unit['path']}: {e}")
+        results = {}
+    after = hedger.stats()
+    return results, {key: after[key] - before[key] for key in after}
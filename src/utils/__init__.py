@@ -2,6 +2,12 @@
 from .cost_calculator import get_model_cost
 from .page_analyzer import analyze_page
 from .usage_parser import parse_bedrock_usage
+from .token_estimator import estimate_image_tokens, estimate_output_tokens
 
-__all__ = ['get_model_cost', 'analyze_page', 'parse_bedrock_usage']
-
+__all__ = [
+    'get_model_cost',
+    'analyze_page',
+    'parse_bedrock_usage',
+    'estimate_image_tokens',
+    'estimate_output_tokens',
+]
@@ -0,0 +1,116 @@
+"""Бюджеты расхода токенов и USD на запуск и на документ."""
+import threading
+from typing import Dict, Optional, Tuple
+
+from src.utils.cost_calculator import get_model_cost
+
+
+class TokenBudget:
+    """
+    Потокобезопасный лимит расхода токенов и USD.
+
+    Перед запросом резервируется худший случай (входные токены + max_tokens),
+    после ответа резерв заменяется фактическим usage. Бюджет документа
+    создается с parent - бюджетом запуска, и резервирует в обоих.
+    """
+
+    def __init__(
+        self,
+        max_cost_usd: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        parent: Optional["TokenBudget"] = None
+    ):
+        """Инициализация бюджета. None - без ограничения."""
+        self.max_cost_usd = max_cost_usd
+        self.max_tokens = max_tokens
+        self.parent = parent
+        self.spent_cost_usd = 0.0
+        self.spent_tokens = 0
+        self._reserved_cost_usd = 0.0
+        self._reserved_tokens = 0
+        self._lock = threading.Lock()
+
+    def _fits(self, tokens: int, cost: float) -> bool:
+        """Проверяет, помещается ли расход в лимиты (вызывается под блокировкой)."""
+        if self.max_tokens is not None and self.spent_tokens + self._reserved_tokens + tokens > self.max_tokens:
+            return False
+        if self.max_cost_usd is not None and self.spent_cost_usd + self._reserved_cost_usd + cost > self.max_cost_usd:
+            return False
+        return True
+
+    def reserve(self, prompt_tokens: int, completion_tokens: int) -> bool:
+        """Резервирует расход запроса. Возвращает False, если бюджет исчерпан."""
+        tokens = prompt_tokens + completion_tokens
+        cost = get_model_cost(prompt_tokens, completion_tokens)
+        with self._lock:
+            if not self._fits(tokens, cost):
+                return False
+            if self.parent is not None and not self.parent.reserve(prompt_tokens, completion_tokens):
+                return False
+            self._reserved_tokens += tokens
+            self._reserved_cost_usd += cost
+            return True
+
+    def settle(self, prompt_tokens: int, completion_tokens: int, usage: Dict[str, int]) -> None:
+        """Снимает резерв запроса и учитывает фактический usage."""
+        with self._lock:
+            self._reserved_tokens -= prompt_tokens + completion_tokens
+            self._reserved_cost_usd -= get_model_cost(prompt_tokens, completion_tokens)
+            self.spent_tokens += usage.get("total_tokens", 0)
+            self.spent_cost_usd += get_model_cost(
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0)
+            )
+        if self.parent is not None:
+            self.parent.settle(prompt_tokens, completion_tokens, usage)
+
+    def limits_left(self) -> Tuple[Optional[float], Optional[int]]:
+        """Остаток лимитов (max_cost_usd, max_tokens) без учета резервов. None - без ограничения."""
+        with self._lock:
+            max_cost_usd = None if self.max_cost_usd is None else self.max_cost_usd - self.spent_cost_usd
+            max_tokens = None if self.max_tokens is None else self.max_tokens - self.spent_tokens
+        return max_cost_usd, max_tokens
+
+    def spent(self) -> Tuple[float, int]:
+        """Фактический расход (USD, токены)."""
+        with self._lock:
+            return self.spent_cost_usd, self.spent_tokens
+
+    def charge(self, cost_usd: float, tokens: int) -> None:
+        """Учитывает расход, зафиксированный в другом бюджете (например, в процессах-обработчиках)."""
+        with self._lock:
+            self.spent_cost_usd += cost_usd
+            self.spent_tokens += tokens
+        if self.parent is not None:
+            self.parent.charge(cost_usd, tokens)
+
+
+class ExtraReservations:
+    """
+    Дополнительные резервы одного запроса сверх исходного: повтор с верхней
+    границей max_tokens или дубль при хеджировании. Их фактический расход входит
+    в usage исходного запроса и учитывается его settle(), поэтому release()
+    снимает резервы без расхода.
+    """
+
+    def __init__(self, budget: TokenBudget, prompt_tokens: int):
+        """prompt_tokens - оценка входных токенов одного повтора запроса."""
+        self.budget = budget
+        self.prompt_tokens = prompt_tokens
+        self._reserved = []
+        self._lock = threading.Lock()
+
+    def reserve(self, completion_tokens: int) -> bool:
+        """Резервирует еще один запрос с completion_tokens. False - бюджет не позволяет."""
+        if not self.budget.reserve(self.prompt_tokens, completion_tokens):
+            return False
+        with self._lock:
+            self._reserved.append(completion_tokens)
+        return True
+
+    def release(self) -> None:
+        """Снимает все дополнительные резервы."""
+        with self._lock:
+            reserved, self._reserved = self._reserved, []
+        for completion_tokens in reserved:
+            self.budget.settle(self.prompt_tokens, completion_tokens, {})
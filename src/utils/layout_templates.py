@@ -0,0 +1,142 @@
+"""Отпечатки разметки страниц и кэш вердиктов классификатора по шаблонам."""
+import hashlib
+import threading
+import fitz
+from typing import Dict, Any, Optional
+
+from config.settings import TEMPLATE_GRID, TEMPLATE_MIN_CONFIRMATIONS
+
+# Толщина (пункты PDF), до которой векторный элемент считается линией, а не прямоугольником
+RULE_THICKNESS_PT = 2.0
+
+
+def layout_fingerprint(page: fitz.Page, grid: int = TEMPLATE_GRID) -> str:
+    """
+    Отпечаток шаблона страницы: размер страницы, левые верхние углы текстовых блоков,
+    горизонтальные и вертикальные линии, прямоугольники и размещение изображений.
+    Координаты округляются до 1/grid страницы, поэтому разные значения в одних и тех же
+    полях формы дают одинаковый отпечаток. Текст страницы не учитывается.
+    """
+    rect = page.rect
+    width = rect.width or 1.0
+    height = rect.height or 1.0
+
+    def qx(x: float) -> int:
+        return int(round((x - rect.x0) / width * grid))
+
+    def qy(y: float) -> int:
+        return int(round((y - rect.y0) / height * grid))
+
+    text_blocks = sorted({
+        (qx(block[0]), qy(block[1]))
+        for block in page.get_text("blocks")
+        if block[6] == 0
+    })
+
+    h_rules, v_rules, boxes = set(), set(), set()
+    for drawing in page.get_drawings():
+        r = drawing["rect"]
+        if r.height <= RULE_THICKNESS_PT:
+            h_rules.add((qy(r.y0), qx(r.x0), qx(r.x1)))
+        elif r.width <= RULE_THICKNESS_PT:
+            v_rules.add((qx(r.x0), qy(r.y0), qy(r.y1)))
+        else:
+            boxes.add((qx(r.x0), qy(r.y0), qx(r.x1), qy(r.y1)))
+
+    images = sorted({
+        (qx(info["bbox"][0]), qy(info["bbox"][1]), qx(info["bbox"][2]), qy(info["bbox"][3]))
+        for info in page.get_image_info()
+    })
+
+    signature = (
+        round(width),
+        round(height),
+        text_blocks,
+        sorted(h_rules),
+        sorted(v_rules),
+        sorted(boxes),
+        images,
+    )
+    return hashlib.sha1(repr(signature).encode("utf-8")).hexdigest()[:16]
+
+
+class TemplateVerdictCache:
+    """
+    Потокобезопасный кэш вердиктов классификатора по отпечаткам шаблонов.
+
+    Вердикт шаблона применяется без запроса к Bedrock после min_confirmations
+    одинаковых классификаций. Если классификации шаблона расходятся, шаблон
+    считается неоднозначным и дальше всегда классифицируется.
+    """
+
+    def __init__(self, min_confirmations: int = TEMPLATE_MIN_CONFIRMATIONS):
+        """Инициализация пустого кэша."""
+        self.min_confirmations = min_confirmations
+        self._clusters: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _cluster(self, fingerprint: str) -> Dict[str, Any]:
+        """Кластер шаблона (вызывается под блокировкой)."""
+        return self._clusters.setdefault(fingerprint, {
+            "pages": 0,
+            "classified": 0,
+            "verdict": None,
+            "conflict": False,
+            "calls_avoided": 0,
+        })
+
+    def lookup(self, fingerprint: str, count: bool = True) -> Optional[bool]:
+        """
+        Учитывает страницу шаблона и возвращает подтвержденный вердикт
+        (has_tables) или None, если страницу нужно классифицировать.
+        count=False - не учитывать страницу в статистике (повторная обработка).
+        """
+        with self._lock:
+            cluster = self._cluster(fingerprint)
+            if count:
+                cluster["pages"] += 1
+            if cluster["conflict"] or cluster["classified"] < self.min_confirmations:
+                return None
+            if count:
+                cluster["calls_avoided"] += 1
+            return cluster["verdict"]
+
+    def record(self, fingerprint: str, has_tables: bool) -> None:
+        """Сохраняет результат успешной классификации страницы шаблона."""
+        with self._lock:
+            cluster = self._cluster(fingerprint)
+            if cluster["classified"] and cluster["verdict"] != has_tables:
+                cluster["conflict"] = True
+            cluster["verdict"] = has_tables
+            cluster["classified"] += 1
+
+    def state(self) -> Dict[str, Dict[str, Any]]:
+        """Копия кластеров (для переноса кэша между процессами)."""
+        with self._lock:
+            return {fp: dict(cluster) for fp, cluster in self._clusters.items()}
+
+    def load(self, state: Dict[str, Dict[str, Any]]) -> None:
+        """Заменяет кластеры копией из state()."""
+        with self._lock:
+            self._clusters = {fp: dict(cluster) for fp, cluster in state.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика кластеров и сэкономленных вызовов классификатора."""
+        with self._lock:
+            clusters = list(self._clusters.items())
+        repeated = [(fp, c) for fp, c in clusters if c["pages"] > 1]
+        return {
+            "clusters": len(clusters),
+            "repeated_clusters": len(repeated),
+            "confirmed_clusters": sum(
+                1 for _, c in clusters
+                if not c["conflict"] and c["classified"] >= self.min_confirmations
+            ),
+            "conflicting_clusters": sum(1 for _, c in clusters if c["conflict"]),
+            "pages": sum(c["pages"] for _, c in clusters),
+            "calls_avoided": sum(c["calls_avoided"] for _, c in clusters),
+            "templates": [
+                {"fingerprint": fp, **c}
+                for fp, c in sorted(repeated, key=lambda item: item[1]["pages"], reverse=True)
+            ],
+        }
@@ -0,0 +1,62 @@
+"""Разбор диапазонов страниц вида "1-50,120,200-"."""
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def parse_page_ranges(spec: str, total_pages: int) -> List[int]:
+    """
+    Разбирает диапазоны страниц (1-based) и возвращает отсортированные 0-based индексы.
+    Поддерживаются "N", "A-B", "A-" (до конца документа) и "-B" (с начала).
+    Диапазоны обрезаются до [1, total_pages], части вне документа пропускаются.
+    Бросает ValueError при некорректной записи или если не выбрано ни одной страницы.
+    """
+    indices = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start_str, end_str = (s.strip() for s in part.split("-", 1))
+            start = int(start_str) if start_str else 1
+            end = int(end_str) if end_str else max(start, total_pages)
+        else:
+            start = end = int(part)
+        if start < 1 or start > end:
+            raise ValueError(f"Некорректный диапазон страниц '{part}'")
+        if start > total_pages:
+            logger.warning(f"Диапазон страниц '{part}' вне документа ({total_pages} стр.), пропущен")
+            continue
+        indices.update(range(start - 1, min(end, total_pages)))
+    if not indices:
+        raise ValueError(f"Не выбрано ни одной страницы из [1, {total_pages}]: '{spec}'")
+    return sorted(indices)
+
+
+def format_page_range(start: int, end: int) -> str:
+    """Форматирует 1-based диапазон страниц для --pages."""
+    return f"{start}-{end}" if start != end else str(start)
+
+
+def resolve_page_indices(
+    total_pages: int,
+    page_index: Optional[int] = None,
+    pages: Optional[str] = None
+) -> Optional[List[int]]:
+    """
+    Возвращает 0-based индексы страниц для обработки: одна страница (page_index),
+    диапазоны (pages) или весь документ. None - если выбор некорректен (ошибка в логе).
+    """
+    if page_index is not None:
+        if page_index < 1 or page_index > total_pages:
+            logger.error(f"Номер страницы {page_index} вне диапазона [1, {total_pages}]")
+            return None
+        return [page_index - 1]
+    if pages:
+        try:
+            return parse_page_ranges(pages, total_pages)
+        except ValueError as e:
+            logger.error(f"Некорректный диапазон страниц: {e}")
+            return None
+    return list(range(total_pages))
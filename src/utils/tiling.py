@@ -0,0 +1,94 @@
+"""Разбиение больших страниц на тайлы и склейка извлеченного текста."""
+import math
+import fitz
+from typing import List
+
+from config.settings import (
+    IMAGE_MAX_EDGE_PX,
+    TILE_OVERSIZE_FACTOR,
+    TILE_DENSE_OUTPUT_TOKENS,
+    TILE_OVERLAP_PT,
+    TILE_MAX_TILES,
+    TILE_MAX_OVERLAP_LINES,
+)
+from src.utils.token_estimator import estimate_text_tokens
+
+
+def plan_tiles(page_rect: fitz.Rect, dpi: int, text_length: int = 0) -> List[List[fitz.Rect]]:
+    """
+    Делит страницу на перекрывающиеся тайлы.
+
+    Большие страницы режутся так, чтобы тайл при заданном DPI не уменьшался моделью,
+    плотные - на горизонтальные полосы с ожидаемым выводом до TILE_DENSE_OUTPUT_TOKENS.
+    Возвращает тайлы по колонкам (каждая колонка - сверху вниз) или пустой список,
+    если страницу резать не нужно.
+    """
+    zoom = dpi / 72.0
+    width_px = page_rect.width * zoom
+    height_px = page_rect.height * zoom
+
+    oversized = max(width_px, height_px) > IMAGE_MAX_EDGE_PX * TILE_OVERSIZE_FACTOR
+    expected_tokens = estimate_text_tokens(text_length)
+    dense = expected_tokens > TILE_DENSE_OUTPUT_TOKENS
+    if not oversized and not dense:
+        return []
+
+    cols = math.ceil(width_px / IMAGE_MAX_EDGE_PX) if oversized else 1
+    rows = math.ceil(height_px / IMAGE_MAX_EDGE_PX) if oversized else 1
+    if dense:
+        rows = max(rows, math.ceil(expected_tokens / TILE_DENSE_OUTPUT_TOKENS))
+    cols = min(cols, TILE_MAX_TILES)
+    rows = max(1, min(rows, TILE_MAX_TILES // cols))
+    if rows * cols == 1:
+        return []
+
+    cell_w = page_rect.width / cols
+    cell_h = page_rect.height / rows
+    half = TILE_OVERLAP_PT / 2.0
+    columns = []
+    for c in range(cols):
+        column = []
+        for r in range(rows):
+            x0 = page_rect.x0 + c * cell_w
+            y0 = page_rect.y0 + r * cell_h
+            tile = fitz.Rect(x0 - half, y0 - half, x0 + cell_w + half, y0 + cell_h + half)
+            column.append(tile & page_rect)
+        columns.append(column)
+    return columns
+
+
+def _normalize_line(line: str) -> str:
+    """Нормализует строку для сравнения на стыке тайлов."""
+    return " ".join(line.split()).lower()
+
+
+def merge_overlap(upper: str, lower: str, max_lines: int = TILE_MAX_OVERLAP_LINES) -> str:
+    """
+    Склеивает текст соседних по вертикали тайлов.
+    Удаляет в начале нижнего тайла строки, повторяющие конец верхнего (зона перекрытия).
+    """
+    upper_lines = upper.splitlines()
+    lower_lines = lower.splitlines()
+    upper_norm = [_normalize_line(line) for line in upper_lines]
+    lower_norm = [_normalize_line(line) for line in lower_lines]
+
+    overlap = 0
+    for k in range(min(max_lines, len(upper_norm), len(lower_norm)), 0, -1):
+        tail = upper_norm[-k:]
+        if tail == lower_norm[:k] and any(tail):
+            overlap = k
+            break
+
+    return "\n".join(upper_lines + lower_lines[overlap:]).strip()
+
+
+def stitch_tiles(columns: List[List[str]]) -> str:
+    """Собирает текст страницы: тайлы колонки склеиваются с удалением дублей, колонки - подряд."""
+    parts = []
+    for column in columns:
+        text = ""
+        for tile_text in column:
+            text = merge_overlap(text, tile_text) if text else tile_text.strip()
+        if text:
+            parts.append(text)
+    return "\n\n".join(parts)
@@ -0,0 +1,85 @@
+"""Локальная оценка количества токенов без обращения к модели."""
+import math
+from typing import Dict, Any
+
+from config.settings import (
+    IMAGE_MAX_EDGE_PX,
+    IMAGE_MAX_TOKENS,
+    IMAGE_PIXELS_PER_TOKEN,
+    CHARS_PER_TOKEN,
+    IMAGE_PAGE_OUTPUT_TOKENS,
+    VLM_EXTRACTION_MAX_TOKENS,
+    VLM_EXTRACTION_MIN_TOKENS,
+    VLM_OUTPUT_TOKENS_MARGIN,
+)
+from config.prompts import VLM_CLASSIFIER_SYSTEM_PROMPT, VLM_EXTRACTION_SYSTEM_PROMPT
+
+# Максимальная длина контекста предыдущей страницы в запросе извлечения
+PREVIOUS_PAGE_CONTEXT_CHARS = 500
+
+
+def estimate_text_tokens(text_length: int) -> int:
+    """Оценивает количество токенов для текста заданной длины."""
+    if text_length <= 0:
+        return 0
+    return int(math.ceil(text_length / CHARS_PER_TOKEN))
+
+
+def estimate_image_tokens(width_px: int, height_px: int) -> int:
+    """
+    Оценивает количество входных токенов изображения по его размерам.
+    Учитывает уменьшение изображения на стороне модели.
+    """
+    if width_px <= 0 or height_px <= 0:
+        return 0
+    long_edge = max(width_px, height_px)
+    if long_edge > IMAGE_MAX_EDGE_PX:
+        scale = IMAGE_MAX_EDGE_PX / long_edge
+        width_px = int(width_px * scale)
+        height_px = int(height_px * scale)
+    tokens = int(math.ceil(width_px * height_px / IMAGE_PIXELS_PER_TOKEN))
+    return min(tokens, IMAGE_MAX_TOKENS)
+
+
+def estimate_page_image_tokens(page_rect: Any, dpi: int) -> int:
+    """Оценивает токены изображения страницы, отрендеренной с заданным DPI."""
+    zoom = dpi / 72.0
+    return estimate_image_tokens(
+        int(page_rect.width * zoom),
+        int(page_rect.height * zoom),
+    )
+
+
+def estimate_output_tokens(page_analysis: Dict[str, Any]) -> int:
+    """
+    Оценивает количество выходных токенов VLM извлечения.
+    Для страниц без текстового слоя используется значение по умолчанию.
+    """
+    if page_analysis["has_almost_no_text"]:
+        return IMAGE_PAGE_OUTPUT_TOKENS
+    return estimate_text_tokens(page_analysis["text_length"])
+
+
+def estimate_max_tokens(page_analysis: Dict[str, Any]) -> int:
+    """
+    Подбирает max_tokens для извлечения текста страницы.
+    Для страниц с текстовым слоем - оценка с запасом, иначе - верхняя граница.
+    """
+    if page_analysis["has_almost_no_text"]:
+        return VLM_EXTRACTION_MAX_TOKENS
+    expected = estimate_text_tokens(page_analysis["text_length"]) * VLM_OUTPUT_TOKENS_MARGIN
+    return int(min(VLM_EXTRACTION_MAX_TOKENS, max(VLM_EXTRACTION_MIN_TOKENS, expected)))
+
+
+def estimate_classifier_prompt_tokens(image_tokens: int) -> int:
+    """Оценивает входные токены запроса классификации."""
+    return image_tokens + estimate_text_tokens(len(VLM_CLASSIFIER_SYSTEM_PROMPT))
+
+
+def estimate_extraction_prompt_tokens(image_tokens: int, previous_text_length: int = 0) -> int:
+    """Оценивает входные токены запроса извлечения текста."""
+    return (
+        image_tokens
+        + estimate_text_tokens(len(VLM_EXTRACTION_SYSTEM_PROMPT))
+        + estimate_text_tokens(min(previous_text_length, PREVIOUS_PAGE_CONTEXT_CHARS))
+    )
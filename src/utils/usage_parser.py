@@ -1,5 +1,5 @@
 """Парсинг метрик использования из ответов Bedrock."""
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 
 def parse_bedrock_usage(response_body: Dict[str, Any]) -> Dict[str, int]:
@@ -15,3 +15,53 @@ def parse_bedrock_usage(response_body: Dict[str, Any]) -> Dict[str, int]:
     
     return usage
 
+
+
+def merge_usage(*usages: Dict[str, int]) -> Dict[str, int]:
+    """Суммирует метрики использования нескольких запросов."""
+    merged = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    for usage in usages:
+        for key, value in usage.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _allocate(total: int, weights: List[float]) -> List[int]:
+    """Делит целое число пропорционально весам (метод наибольшего остатка)."""
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        weights = [1.0] * len(weights)
+        weight_sum = float(len(weights))
+    shares = [total * w / weight_sum for w in weights]
+    result = [int(share) for share in shares]
+    remainders = sorted(range(len(shares)), key=lambda i: shares[i] - result[i], reverse=True)
+    for i in remainders[:total - sum(result)]:
+        result[i] += 1
+    return result
+
+
+def split_usage(usage: Dict[str, int], completion_weights: List[float]) -> List[Dict[str, int]]:
+    """
+    Делит usage одного запроса с несколькими страницами между страницами.
+    Входные токены делятся поровну (по изображению на страницу),
+    выходные - пропорционально completion_weights (например, длине текста страницы).
+    """
+    count = len(completion_weights)
+    prompt = _allocate(usage.get("prompt_tokens", 0), [1.0] * count)
+    completion = _allocate(usage.get("completion_tokens", 0), completion_weights)
+    hedge_prompt = _allocate(usage.get("hedge_prompt_tokens", 0), [1.0] * count)
+    hedge_completion = _allocate(usage.get("hedge_completion_tokens", 0), completion_weights)
+
+    shares = []
+    for i in range(count):
+        share = {
+            "prompt_tokens": prompt[i],
+            "completion_tokens": completion[i],
+            "total_tokens": prompt[i] + completion[i],
+        }
+        if "hedge_tokens" in usage:
+            share["hedge_prompt_tokens"] = hedge_prompt[i]
+            share["hedge_completion_tokens"] = hedge_completion[i]
+            share["hedge_tokens"] = hedge_prompt[i] + hedge_completion[i]
+        shares.append(share)
+    return shares